@@ -5,7 +5,6 @@ from flask_login import LoginManager
 from flask_wtf.csrf import CSRFProtect, CSRFError
 
 
-import dmapiclient
 import dmcontent.govuk_frontend
 from dmutils import init_app
 from dmutils.user import User
@@ -14,8 +13,10 @@ from govuk_frontend_jinja.flask_ext import init_govuk_frontend
 
 from config import configs
 
+from .data_api import PooledDataAPIClient, RequestMemoizingDataAPIClient
 
-data_api_client = dmapiclient.DataAPIClient()
+
+data_api_client = RequestMemoizingDataAPIClient(PooledDataAPIClient())
 login_manager = LoginManager()
 csrf = CSRFProtect()
 
@@ -0,0 +1,337 @@
+from collections import OrderedDict
+from threading import Event, Lock, Thread
+from time import monotonic
+
+from .metrics import (
+    CACHE_EVICTIONS_TOTAL,
+    CACHE_LOOKUPS_TOTAL,
+    CIRCUIT_BREAKER_EVENTS_TOTAL,
+    SINGLE_FLIGHT_CALLS_TOTAL,
+    STALE_CACHE_RESPONSES_TOTAL,
+)
+
+_missing = object()
+
+
+class LRUCache(object):
+    """A threadsafe in-process cache which evicts its least recently used entries once it holds `maxsize` of them.
+
+    Entries can optionally expire `ttl` seconds after they were set. Lookups and evictions are counted by cache `name`
+    on the metrics endpoint (`cache_lookups_total` and `cache_evictions_total`) so the size can be tuned.
+
+    Caches are typically created at import time and then sized from the app config with `configure`, which also
+    empties them.
+    """
+
+    def __init__(self, name, maxsize=128, ttl=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def configure(self, maxsize=None, ttl=None):
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if ttl is not None:
+                self.ttl = ttl
+            self._entries.clear()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= monotonic():
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                CACHE_LOOKUPS_TOTAL.labels(self.name, 'miss').inc()
+                return default
+
+            self._entries.move_to_end(key)
+            CACHE_LOOKUPS_TOTAL.labels(self.name, 'hit').inc()
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = None if ttl is None else monotonic() + ttl
+
+        with self._lock:
+            if self.maxsize <= 0:
+                return
+
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                CACHE_EVICTIONS_TOTAL.labels(self.name).inc()
+
+    def get_or_set(self, key, make_value, ttl=None):
+        """Return the cached value for `key`, calling `make_value()` to fill the cache if there isn't one"""
+        value = self.get(key, _missing)
+        if value is _missing:
+            value = make_value()
+            self.set(key, value, ttl=ttl)
+        return value
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = Event()
+        self.finished_at = None
+        self.result = None
+        self.exception = None
+
+
+class SingleFlight(object):
+    """Lets concurrent callers asking for the same key share a single call to fetch it.
+
+    The first caller for a key makes the call and anyone asking for the same key while it's in flight waits for it and
+    gets the same result (or exception). A successful result is also shared with anyone asking up to `window` seconds
+    after it arrived, which smooths over bursts of requests for the same thing. Results are shared, not copied, so
+    must be treated as read-only.
+
+    Calls made and shared are counted by `name` on the metrics endpoint (`single_flight_calls_total`).
+    """
+
+    def __init__(self, name, window=0):
+        self.name = name
+        self.window = window
+        self._calls = {}
+        self._lock = Lock()
+
+    def configure(self, window=None):
+        with self._lock:
+            if window is not None:
+                self.window = window
+            self._calls.clear()
+
+    def do(self, key, fetch):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None or self._has_expired(call):
+                self._forget_expired_calls()
+                call = self._calls[key] = _Call()
+                is_leader = True
+            else:
+                is_leader = False
+
+        if not is_leader:
+            SINGLE_FLIGHT_CALLS_TOTAL.labels(self.name, 'shared').inc()
+            call.done.wait()
+            if call.exception is not None:
+                raise call.exception
+            return call.result
+
+        SINGLE_FLIGHT_CALLS_TOTAL.labels(self.name, 'made').inc()
+        try:
+            call.result = fetch()
+            return call.result
+        except Exception as e:
+            call.exception = e
+            raise
+        finally:
+            with self._lock:
+                call.finished_at = monotonic()
+                if (call.exception is not None or self.window <= 0) and self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+
+    def _has_expired(self, call):
+        return call.finished_at is not None and monotonic() - call.finished_at >= self.window
+
+    def _forget_expired_calls(self):
+        for key, call in list(self._calls.items()):
+            if self._has_expired(call):
+                del self._calls[key]
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker(object):
+    """Stops calling something which keeps failing, giving it a chance to recover rather than piling more work on it.
+
+    After `failure_threshold` failures in a row (as decided by `is_failure`) the circuit opens, and for the next
+    `reset_timeout` seconds `call` raises the error made by `open_error` without calling anything. After that a single
+    trial call is let through: if it succeeds the circuit closes again, and if it fails it stays open for another
+    `reset_timeout` seconds.
+
+    Circuits opening and closing, and calls rejected while open, are counted by `name` on the metrics endpoint
+    (`circuit_breaker_events_total`).
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = Lock()
+
+    def configure(self, failure_threshold=None, reset_timeout=None):
+        with self._lock:
+            if failure_threshold is not None:
+                self.failure_threshold = failure_threshold
+            if reset_timeout is not None:
+                self.reset_timeout = reset_timeout
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def is_failure(self, exception):
+        """Whether `exception` counts towards opening the circuit - by default anything does"""
+        return True
+
+    def is_unavailable(self, exception):
+        """Whether `exception` means what's behind the circuit can't be reached at the moment"""
+        return isinstance(exception, CircuitOpenError) or self.is_failure(exception)
+
+    def open_error(self):
+        return CircuitOpenError("Circuit {} is open".format(self.name))
+
+    def call(self, fetch):
+        is_trial = self._before_call()
+        try:
+            result = fetch()
+        except Exception as e:
+            self._after_call(is_trial, failed=self.is_failure(e))
+            raise
+        self._after_call(is_trial, failed=False)
+        return result
+
+    def _before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if self._trial_in_flight or monotonic() - self._opened_at < self.reset_timeout:
+                CIRCUIT_BREAKER_EVENTS_TOTAL.labels(self.name, 'rejected').inc()
+                raise self.open_error()
+            self._trial_in_flight = True
+            return True
+
+    def _after_call(self, is_trial, failed):
+        with self._lock:
+            if is_trial:
+                self._trial_in_flight = False
+
+            if not failed:
+                if self._opened_at is not None:
+                    CIRCUIT_BREAKER_EVENTS_TOTAL.labels(self.name, 'closed').inc()
+                self._failures = 0
+                self._opened_at = None
+                return
+
+            self._failures += 1
+            if is_trial or (self._opened_at is None and self._failures >= self.failure_threshold):
+                if self._opened_at is None:
+                    CIRCUIT_BREAKER_EVENTS_TOTAL.labels(self.name, 'opened').inc()
+                self._opened_at = monotonic()
+
+
+class StaleWhileRevalidateCache(object):
+    """A cache for lookups from a slow or unreliable service, which would rather serve slightly old values than none.
+
+    * for `ttl` seconds after a value was fetched it's served straight from the cache
+    * for `stale_ttl` seconds after that it's still served, while a background thread fetches a fresh one
+    * up to `stale_if_error_ttl` seconds after it was fetched it's served if fetching a fresh one fails because the
+      service is unavailable - including when `circuit_breaker` is open, so we don't even try
+
+    Otherwise the caller waits for the value to be fetched and gets any error as usual. Fetches are made through
+    `circuit_breaker`, which also decides which errors mean the service is unavailable. Values are shared, not copied,
+    so must be treated as read-only.
+
+    Stale values served are counted by `name` and reason on the metrics endpoint (`stale_cache_responses_total`),
+    along with the usual cache lookups and evictions.
+    """
+
+    def __init__(self, name, circuit_breaker, maxsize=128, ttl=60, stale_ttl=0, stale_if_error_ttl=0):
+        self.name = name
+        self.circuit_breaker = circuit_breaker
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.stale_if_error_ttl = stale_if_error_ttl
+        self._entries = LRUCache(name, maxsize=maxsize)
+        self._revalidating = set()
+        self._lock = Lock()
+
+    def configure(self, maxsize=None, ttl=None, stale_ttl=None, stale_if_error_ttl=None):
+        if ttl is not None:
+            self.ttl = ttl
+        if stale_ttl is not None:
+            self.stale_ttl = stale_ttl
+        if stale_if_error_ttl is not None:
+            self.stale_if_error_ttl = stale_if_error_ttl
+        self._entries.configure(maxsize=maxsize)
+
+    def get_or_fetch(self, key, fetch):
+        """Return the value for `key`, calling `fetch()` (in the background if there's a stale value) as needed"""
+        entry = self._entries.get(key)
+        age = None if entry is None else monotonic() - entry[1]
+
+        if age is not None and age < self.ttl:
+            return entry[0]
+
+        if age is not None and age < self.ttl + self.stale_ttl:
+            STALE_CACHE_RESPONSES_TOTAL.labels(self.name, 'revalidating').inc()
+            self._revalidate_in_background(key, fetch)
+            return entry[0]
+
+        try:
+            return self._fetch(key, fetch)
+        except Exception as e:
+            if age is None or age >= self.stale_if_error_ttl or not self.circuit_breaker.is_unavailable(e):
+                raise
+            STALE_CACHE_RESPONSES_TOTAL.labels(self.name, 'unavailable').inc()
+            return entry[0]
+
+    def delete(self, key):
+        self._entries.delete(key)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _fetch(self, key, fetch):
+        value = self.circuit_breaker.call(fetch)
+        self._entries.set(key, (value, monotonic()), ttl=max(self.ttl + self.stale_ttl, self.stale_if_error_ttl))
+        return value
+
+    def _revalidate_in_background(self, key, fetch):
+        with self._lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+
+        Thread(target=self._revalidate, args=(key, fetch), name='revalidate-{}'.format(self.name), daemon=True).start()
+
+    def _revalidate(self, key, fetch):
+        try:
+            self._fetch(key, fetch)
+        except Exception:
+            # the stale value is kept (until it expires) and the next lookup will try again
+            pass
+        finally:
+            with self._lock:
+                self._revalidating.discard(key)
@@ -0,0 +1,512 @@
+import re
+from collections import deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from functools import partial, wraps
+from math import ceil
+from threading import BoundedSemaphore, Event, Lock, local
+from time import perf_counter
+from urllib.parse import urlparse
+
+import requests
+from dmapiclient import APIError, DataAPIClient
+from flask import copy_current_request_context, current_app, g, has_app_context, has_request_context
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from .cache import CircuitBreaker, CircuitOpenError, LRUCache
+from .metrics import (
+    DATA_API_CONCURRENT_FETCHES_TOTAL,
+    DATA_API_CONDITIONAL_GETS_TOTAL,
+    DATA_API_CONNECTION_POOL_EXHAUSTED_TOTAL,
+    DATA_API_CONNECTIONS_CREATED_TOTAL,
+    DATA_API_CONNECTIONS_DISCARDED_TOTAL,
+    DATA_API_HEDGED_REQUESTS_TOTAL,
+)
+
+
+READ_METHOD_PREFIXES = ('get_', 'find_', 'is_')
+
+# reads returning plain JSON which RequestMemoizingDataAPIClient remembers for the rest of the request - other reads
+# (like the `find_*_iter` generators) go straight to the API
+MEMOIZED_READ_METHODS = frozenset((
+    'find_brief_responses',
+    'find_services',
+    'get_brief',
+    'get_brief_response',
+    'get_framework',
+    'get_supplier_framework_info',
+    'get_user',
+    'is_supplier_eligible_for_brief',
+))
+
+
+class _InstrumentedConnectionPoolMixin(object):
+    def _new_conn(self):
+        DATA_API_CONNECTIONS_CREATED_TOTAL.inc()
+        return super()._new_conn()
+
+    def _get_conn(self, timeout=None):
+        # every connection the pool allows is in use, so we either wait for one or (if not blocking) open another
+        if self.pool is not None and self.pool.empty():
+            DATA_API_CONNECTION_POOL_EXHAUSTED_TOTAL.inc()
+        return super()._get_conn(timeout=timeout)
+
+    def _put_conn(self, conn):
+        # a connection opened beyond the pool size which can't be kept alive
+        if self.pool is not None and self.pool.full():
+            DATA_API_CONNECTIONS_DISCARDED_TOTAL.inc()
+        return super()._put_conn(conn)
+
+
+class _InstrumentedHTTPConnectionPool(_InstrumentedConnectionPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _InstrumentedHTTPSConnectionPool(_InstrumentedConnectionPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class _InstrumentedHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _InstrumentedHTTPConnectionPool,
+            'https': _InstrumentedHTTPSConnectionPool,
+        }
+
+
+# briefs and brief responses, which are looked up on every page of the brief response flow
+CONDITIONAL_GET_PATHS = re.compile(r'/(briefs|brief-responses)/\d+$')
+
+_CachedResponse = namedtuple('_CachedResponse', ['etag', 'last_modified', 'data'])
+
+
+class _ConditionalGetSession(requests.Session):
+    """A Session which revalidates GETs for CONDITIONAL_GET_PATHS against responses kept in `response_cache`.
+
+    Responses with an ETag or Last-Modified header are kept (decoded) along with those validators. The next GET for
+    the same URL sends them as If-None-Match/If-Modified-Since, and if the API answers 304 Not Modified the response's
+    `json()` returns the kept data, so neither the body nor decoding it are repeated. That data is shared, so must be
+    treated as read-only.
+    """
+
+    def __init__(self, response_cache):
+        super().__init__()
+        self._response_cache = response_cache
+
+    def request(self, method, url, headers=None, **kwargs):
+        if method != 'GET' or not CONDITIONAL_GET_PATHS.search(urlparse(url).path):
+            return super().request(method, url, headers=headers, **kwargs)
+
+        cached = self._response_cache.get(url)
+        response = super().request(method, url, headers=self._conditional_headers(headers, cached), **kwargs)
+
+        if response.status_code == 304 and cached is not None:
+            DATA_API_CONDITIONAL_GETS_TOTAL.labels('not_modified').inc()
+            response.json = lambda **json_kwargs: cached.data
+            return response
+
+        DATA_API_CONDITIONAL_GETS_TOTAL.labels('miss' if cached is None else 'modified').inc()
+        etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+        if response.status_code != 200 or not (etag or last_modified):
+            self._response_cache.delete(url)
+            return response
+
+        decode = response.json
+
+        def json_and_cache(**json_kwargs):
+            data = decode(**json_kwargs)
+            self._response_cache.set(url, _CachedResponse(etag, last_modified, data))
+            return data
+
+        response.json = json_and_cache
+        return response
+
+    @staticmethod
+    def _conditional_headers(headers, cached):
+        headers = CaseInsensitiveDict(headers or {})
+        if cached is not None and cached.etag:
+            headers['If-None-Match'] = cached.etag
+        if cached is not None and cached.last_modified:
+            headers['If-Modified-Since'] = cached.last_modified
+        return headers
+
+
+# the result of a hedge which wasn't sent, as the request answered in time or the budget was used up
+_NOT_HEDGED = object()
+
+
+class _HedgedEndpoint(object):
+    """Response times and hedging budget for the data API paths matching `pattern`.
+
+    Once `min_samples` response times have been seen, `delay` is the `percentile` of the last `history` of them. Each
+    request adds `budget` to the tokens available for hedging (up to `max_tokens`), and each hedge uses one - so
+    hedging adds at most `budget` requests per request, plus short bursts.
+    """
+
+    def __init__(self, pattern, percentile, budget, history=100, min_samples=20, max_tokens=10):
+        self.pattern = pattern
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.max_tokens = max_tokens
+        self._durations = deque(maxlen=history)
+        self._tokens = 0
+        self._lock = Lock()
+
+    def record(self, duration):
+        with self._lock:
+            self._durations.append(duration)
+
+    def delay(self):
+        with self._lock:
+            self._tokens = min(self._tokens + self.budget, self.max_tokens)
+            if len(self._durations) < self.min_samples:
+                return None
+            durations = sorted(self._durations)
+        return durations[max(int(ceil(len(durations) * self.percentile / 100)), 1) - 1]
+
+    def take_token(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class PooledDataAPIClient(DataAPIClient):
+    """A DataAPIClient which keeps connections to the API alive between requests.
+
+    DataAPIClient sets up a new requests Session - and with it new connections - for every request it makes. This
+    client shares connection pools between every request and thread instead, sized from the app config:
+
+    * DM_DATA_API_POOL_CONNECTIONS: the number of hosts to keep pools for
+    * DM_DATA_API_POOL_MAXSIZE: the number of connections to each host to keep alive
+    * DM_DATA_API_POOL_BLOCK: whether to wait for a connection when they're all in use, rather than opening another
+      (which is closed afterwards)
+
+    Connections opened, times a pool was exhausted and connections thrown away because the pool was full are counted
+    on the metrics endpoint.
+
+    Briefs and brief responses are fetched with conditional GETs (see `_ConditionalGetSession`), keeping up to
+    DM_DATA_API_RESPONSE_CACHE_SIZE responses to revalidate.
+
+    GETs for paths matching any of the DM_DATA_API_HEDGED_PATHS patterns can be hedged: if there's no answer after the
+    DM_DATA_API_HEDGE_PERCENTILE of that path's recent response times, the same request is made again. The request
+    itself is made on the calling thread, which waits for it, so the hedge's answer is used if the request fails.
+    DM_DATA_API_HEDGE_BUDGET limits the extra requests for each pattern to that fraction of its requests. Hedges are
+    made on a pool of DM_DATA_API_HEDGE_WORKERS threads, and requests made while every one of them is busy aren't
+    hedged rather than waiting for one.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool_connections = requests.adapters.DEFAULT_POOLSIZE
+        self._pool_maxsize = requests.adapters.DEFAULT_POOLSIZE
+        self._pool_block = requests.adapters.DEFAULT_POOLBLOCK
+        self._adapters = {}
+        self._adapters_lock = Lock()
+        self._response_cache = LRUCache('data_api_responses')
+        self._hedged_endpoints = []
+        self._hedge_executor = None
+        self._hedge_slots = None
+
+    def init_app(self, app):
+        super().init_app(app)
+        self.configure_pool(
+            connections=app.config['DM_DATA_API_POOL_CONNECTIONS'],
+            maxsize=app.config['DM_DATA_API_POOL_MAXSIZE'],
+            block=app.config['DM_DATA_API_POOL_BLOCK'],
+        )
+        self._response_cache.configure(maxsize=app.config['DM_DATA_API_RESPONSE_CACHE_SIZE'])
+        self.configure_hedging(
+            paths=app.config['DM_DATA_API_HEDGED_PATHS'],
+            percentile=app.config['DM_DATA_API_HEDGE_PERCENTILE'],
+            budget=app.config['DM_DATA_API_HEDGE_BUDGET'],
+            workers=app.config['DM_DATA_API_HEDGE_WORKERS'],
+        )
+
+    def configure_pool(self, connections, maxsize, block):
+        with self._adapters_lock:
+            self._pool_connections = connections
+            self._pool_maxsize = maxsize
+            self._pool_block = block
+            # requests already using the old pools can finish with them - they're just no longer handed out
+            self._adapters = {}
+
+    def configure_hedging(self, paths, percentile, budget, workers, **endpoint_kwargs):
+        self._hedged_endpoints = [
+            _HedgedEndpoint(re.compile(path), percentile, budget, **endpoint_kwargs) for path in paths
+        ]
+        if self._hedged_endpoints and self._hedge_executor is None:
+            self._hedge_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='data-api-hedge')
+            self._hedge_slots = BoundedSemaphore(workers)
+
+    def _request(self, method, url, *args, **kwargs):
+        endpoint = self._get_hedged_endpoint(method, url)
+        request = partial(super()._request, method, url, *args, **kwargs)
+        if endpoint is None:
+            return request()
+
+        delay = endpoint.delay()
+        if delay is None:
+            # not enough response times yet to know what's slow
+            return self._timed_request(endpoint, request)
+
+        return self._hedged_request(endpoint, delay, request)
+
+    def _get_hedged_endpoint(self, method, url):
+        if method != 'GET':
+            return None
+        path = urlparse(url).path
+        return next((endpoint for endpoint in self._hedged_endpoints if endpoint.pattern.search(path)), None)
+
+    def _hedged_request(self, endpoint, delay, request):
+        primary_done = Event()
+        hedge = self._submit_hedge(endpoint, delay, request, primary_done)
+        try:
+            return self._timed_request(endpoint, request)
+        except Exception:
+            primary_done.set()
+            if hedge is None or hedge.exception() is not None or hedge.result() is _NOT_HEDGED:
+                raise
+            DATA_API_HEDGED_REQUESTS_TOTAL.labels(endpoint.pattern.pattern, 'hedge_answered').inc()
+            return hedge.result()
+        finally:
+            primary_done.set()
+
+    def _submit_hedge(self, endpoint, delay, request, primary_done):
+        """Start a hedge for `request` on the pool if it has a thread free to make it, otherwise return None.
+
+        The hedge is only sent if `primary_done` isn't set within `delay` and the endpoint's budget allows it - if not,
+        the future's result is `_NOT_HEDGED`.
+        """
+        if not self._hedge_slots.acquire(blocking=False):
+            DATA_API_HEDGED_REQUESTS_TOTAL.labels(endpoint.pattern.pattern, 'pool_busy').inc()
+            return None
+
+        def hedge():
+            if primary_done.wait(delay):
+                return _NOT_HEDGED
+            if not endpoint.take_token():
+                DATA_API_HEDGED_REQUESTS_TOTAL.labels(endpoint.pattern.pattern, 'over_budget').inc()
+                return _NOT_HEDGED
+            DATA_API_HEDGED_REQUESTS_TOTAL.labels(endpoint.pattern.pattern, 'hedged').inc()
+            return self._timed_request(endpoint, request)
+
+        if has_request_context():
+            hedge = copy_current_request_context(hedge)
+        future = self._hedge_executor.submit(hedge)
+        future.add_done_callback(lambda future: self._hedge_slots.release())
+        return future
+
+    @staticmethod
+    def _timed_request(endpoint, request):
+        start = perf_counter()
+        try:
+            return request()
+        finally:
+            endpoint.record(perf_counter() - start)
+
+    def _get_adapter(self, retry_read_timeouts):
+        adapter = self._adapters.get(retry_read_timeouts)
+        if adapter is not None:
+            return adapter
+
+        with self._adapters_lock:
+            if retry_read_timeouts not in self._adapters:
+                # take the retry policy from the session DataAPIClient would have used
+                max_retries = super()._requests_retry_session(
+                    retry_read_timeouts=retry_read_timeouts
+                ).get_adapter('https://').max_retries
+                self._adapters[retry_read_timeouts] = _InstrumentedHTTPAdapter(
+                    pool_connections=self._pool_connections,
+                    pool_maxsize=self._pool_maxsize,
+                    pool_block=self._pool_block,
+                    max_retries=max_retries,
+                )
+            return self._adapters[retry_read_timeouts]
+
+    def _requests_retry_session(self, *, retry_read_timeouts=True):
+        # sessions are cheap and not entirely threadsafe, so each request still gets its own - it's the adapters (and
+        # their connection pools) which are shared
+        adapter = self._get_adapter(retry_read_timeouts)
+        session = _ConditionalGetSession(self._response_cache)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+
+class RequestMemoizingDataAPIClient(object):
+    """Wraps a DataAPIClient so each distinct call to one of its MEMOIZED_READ_METHODS only hits the API once per
+    request.
+
+    Results are kept on `flask.g`, so they're thrown away when the request ends. Every caller in the request gets the
+    same response object, so responses mustn't be changed - copy one first to do that. Other reads go straight through
+    to the API, and calling any other method (anything which might write) forgets everything remembered so far for the
+    request. Outside an app context calls go straight through to the API.
+
+    The number of calls saved is logged at the end of each request which had any.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def init_app(self, app):
+        self._client.init_app(app)
+        app.teardown_appcontext(self._log_and_clear)
+
+    def __dir__(self):
+        # so that tools like `mock.create_autospec` can see the wrapped client's methods
+        return sorted(set(super().__dir__()) | set(dir(self._client)))
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+        if name in MEMOIZED_READ_METHODS:
+            return self._memoized(name, attr)
+        if name.startswith(READ_METHOD_PREFIXES):
+            return attr
+        return self._forgetting(attr)
+
+    def _memoized(self, name, method):
+        @wraps(method)
+        def memoized_method(*args, **kwargs):
+            if not has_app_context():
+                return method(*args, **kwargs)
+
+            key = (name, args, tuple(sorted(kwargs.items())))
+            try:
+                hash(key)
+            except TypeError:
+                return method(*args, **kwargs)
+
+            responses = g.setdefault('_data_api_responses', {})
+            if key in responses:
+                g._data_api_deduplicated_calls = g.get('_data_api_deduplicated_calls', 0) + 1
+            else:
+                responses[key] = method(*args, **kwargs)
+
+            return responses[key]
+
+        return memoized_method
+
+    def _forgetting(self, method):
+        @wraps(method)
+        def forgetting_method(*args, **kwargs):
+            if has_app_context():
+                g.pop('_data_api_responses', None)
+            return method(*args, **kwargs)
+
+        return forgetting_method
+
+    def _log_and_clear(self, exception):
+        deduplicated_calls = g.pop('_data_api_deduplicated_calls', 0)
+        g.pop('_data_api_responses', None)
+
+        if deduplicated_calls:
+            current_app.logger.info(
+                "Saved {deduplicated_calls} duplicate data API calls",
+                extra={'deduplicated_calls': deduplicated_calls},
+            )
+
+
+class DataAPICircuitOpenError(CircuitOpenError, APIError):
+    """Raised instead of calling the data API while its circuit is open - handled like any other (503) API error"""
+
+
+class DataAPICircuitBreaker(CircuitBreaker):
+    """Opens after repeated data API timeouts, connection failures and server errors.
+
+    Other errors (like a 404) mean the API is answering, so count as successes.
+    """
+
+    def is_failure(self, exception):
+        return isinstance(exception, APIError) and exception.status_code >= 500
+
+    def open_error(self):
+        return DataAPICircuitOpenError(message="Data API circuit {} is open".format(self.name))
+
+
+# configured from DM_DATA_API_CIRCUIT_BREAKER_THRESHOLD and DM_DATA_API_CIRCUIT_BREAKER_RESET_TIMEOUT when the app is
+# created, and shared by the lookups cached in StaleWhileRevalidateCaches
+data_api_circuit_breaker = DataAPICircuitBreaker('data_api')
+
+
+_fetch_executor = None
+_fetch_slots = None
+_fetch_executor_lock = Lock()
+_fetch_worker = local()
+
+
+def _get_fetch_executor():
+    global _fetch_executor, _fetch_slots
+    with _fetch_executor_lock:
+        if _fetch_executor is None:
+            _fetch_slots = BoundedSemaphore(current_app.config['DM_DATA_API_FETCH_WORKERS'])
+            _fetch_executor = ThreadPoolExecutor(
+                max_workers=current_app.config['DM_DATA_API_FETCH_WORKERS'],
+                thread_name_prefix='data-api-fetch',
+            )
+        return _fetch_executor
+
+
+def _call_in_fetch_worker(fetch):
+    _fetch_worker.active = True
+    try:
+        return fetch()
+    finally:
+        _fetch_worker.active = False
+
+
+def _submit_fetch(executor, fetch):
+    """Start `fetch` on the pool if it has a thread free to make it straight away, otherwise return None"""
+    if not _fetch_slots.acquire(blocking=False):
+        return None
+
+    DATA_API_CONCURRENT_FETCHES_TOTAL.labels('pool').inc()
+    future = executor.submit(copy_current_request_context(_call_in_fetch_worker), fetch)
+    future.add_done_callback(lambda future: _fetch_slots.release())
+    return future
+
+
+def _call_in_caller(fetch):
+    DATA_API_CONCURRENT_FETCHES_TOTAL.labels('caller').inc()
+    future = Future()
+    try:
+        future.set_result(_call_in_fetch_worker(fetch))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def fetch_concurrently(*fetches):
+    """Call `fetches` (functions taking no arguments which don't depend on each other) at the same time, returning
+    a list of their results in the same order.
+
+    The first function is called on the calling thread. The others are each called on a thread from a pool of
+    DM_DATA_API_FETCH_WORKERS threads shared by the whole process, in a copy of the current request context. That means
+    `current_app` and `request` work as usual, but `g` is not shared with the caller. `current_user` is loaded per
+    context, so read anything needed from it beforehand. Rather than queueing behind other requests' fetches when every
+    pool thread is busy, the rest are called on the calling thread, one after another.
+
+    If any of the functions raise, the first exception (in the order `fetches` were given) is raised once they have
+    all finished. Outside a request context, or when called from one of the functions, the functions are just called
+    one after another.
+    """
+    if (
+        len(fetches) < 2
+        or not has_request_context()
+        or getattr(_fetch_worker, 'active', False)
+        or current_app.config['DM_DATA_API_FETCH_WORKERS'] < 1
+    ):
+        return [fetch() for fetch in fetches]
+
+    executor = _get_fetch_executor()
+    futures = [None] + [_submit_fetch(executor, fetch) for fetch in fetches[1:]]
+    futures = [future or _call_in_caller(fetch) for future, fetch in zip(futures, fetches)]
+    wait(futures)
+
+    return [future.result() for future in futures]
@@ -1,63 +1,131 @@
-from copy import deepcopy
 from functools import partial
 
 from flask import Blueprint
-from dmcontent.content_loader import ContentLoader
 from dmutils.access_control import require_login
-from dmutils.timing import logged_duration
-from werkzeug.local import Local, LocalProxy
+
+from .helpers.content import (
+    BundledContentLoader,
+    SharedContentLoader,
+    brief_summary_cache,
+    filtered_manifest_cache,
+    read_content_bundle,
+)
+from ..data_api import data_api_circuit_breaker
+from .helpers.briefs import (
+    brief_cache,
+    brief_fetches,
+    supplier_eligibility_cache,
+    supplier_services_cache,
+)
+from .helpers.frameworks import framework_cache, opportunities_dashboard_cache
 
 main = Blueprint('main', __name__)
 public = Blueprint('public', __name__)  # Supplier login not required
 
-# we use our own Local for objects we explicitly want to be able to retain between requests but shouldn't
-# share a common object between concurrent threads/contexts
-_local = Local()
-
-
-def _make_content_loader_factory():
-    primary_cl = ContentLoader('app/content')
-
-    primary_cl.load_manifest('digital-outcomes-and-specialists', 'briefs', 'edit_brief')
-    primary_cl.load_manifest('digital-outcomes-and-specialists', 'brief-responses', 'legacy_edit_brief_response')
-    primary_cl.load_manifest('digital-outcomes-and-specialists', 'brief-responses', 'edit_brief_response')
-    primary_cl.load_manifest('digital-outcomes-and-specialists', 'brief-responses', 'legacy_display_brief_response')
-    primary_cl.load_manifest('digital-outcomes-and-specialists', 'brief-responses', 'display_brief_response')
-
-    primary_cl.load_manifest('digital-outcomes-and-specialists-2', 'briefs', 'edit_brief')
-    primary_cl.load_manifest('digital-outcomes-and-specialists-2', 'brief-responses', 'edit_brief_response')
-    primary_cl.load_manifest('digital-outcomes-and-specialists-2', 'brief-responses', 'display_brief_response')
-
-    primary_cl.load_manifest('digital-outcomes-and-specialists-3', 'briefs', 'edit_brief')
-    primary_cl.load_manifest('digital-outcomes-and-specialists-3', 'brief-responses', 'edit_brief_response')
-    primary_cl.load_manifest('digital-outcomes-and-specialists-3', 'brief-responses', 'display_brief_response')
-
-    primary_cl.load_manifest('digital-outcomes-and-specialists-4', 'briefs', 'edit_brief')
-    primary_cl.load_manifest('digital-outcomes-and-specialists-4', 'brief-responses', 'edit_brief_response')
-    primary_cl.load_manifest('digital-outcomes-and-specialists-4', 'brief-responses', 'display_brief_response')
 
-    primary_cl.load_manifest('digital-outcomes-and-specialists-5', 'briefs', 'edit_brief')
-    primary_cl.load_manifest('digital-outcomes-and-specialists-5', 'brief-responses', 'edit_brief_response')
-    primary_cl.load_manifest('digital-outcomes-and-specialists-5', 'brief-responses', 'display_brief_response')
+CONTENT_PATH = 'app/content'
+# built by scripts/build_content_bundle.py - see `write_content_bundle`
+CONTENT_BUNDLE_PATH = 'app/content/content-bundle.pickle'
+
+# question set for each manifest we use, by framework
+CONTENT_MANIFESTS = {
+    'digital-outcomes-and-specialists': {
+        'edit_brief': 'briefs',
+        'legacy_edit_brief_response': 'brief-responses',
+        'edit_brief_response': 'brief-responses',
+        'legacy_display_brief_response': 'brief-responses',
+        'display_brief_response': 'brief-responses',
+    },
+    'digital-outcomes-and-specialists-2': {
+        'edit_brief': 'briefs',
+        'edit_brief_response': 'brief-responses',
+        'display_brief_response': 'brief-responses',
+    },
+    'digital-outcomes-and-specialists-3': {
+        'edit_brief': 'briefs',
+        'edit_brief_response': 'brief-responses',
+        'display_brief_response': 'brief-responses',
+    },
+    'digital-outcomes-and-specialists-4': {
+        'edit_brief': 'briefs',
+        'edit_brief_response': 'brief-responses',
+        'display_brief_response': 'brief-responses',
+    },
+    'digital-outcomes-and-specialists-5': {
+        'edit_brief': 'briefs',
+        'edit_brief_response': 'brief-responses',
+        'display_brief_response': 'brief-responses',
+    },
+}
+
+
+def _make_content_loader():
+    # manifests are taken from the prebuilt content bundle if there's an up to date one, saving us from parsing the YAML
+    primary_cl = BundledContentLoader(
+        CONTENT_PATH,
+        read_content_bundle(CONTENT_BUNDLE_PATH, CONTENT_PATH, CONTENT_MANIFESTS),
+    )
+
+    # manifests are only loaded the first time they're used (or when listed in DM_CONTENT_PRELOAD_MANIFESTS), so
+    # legacy frameworks don't cost us anything unless someone actually looks at a legacy brief response
+    for framework_slug, manifests in CONTENT_MANIFESTS.items():
+        primary_cl.lazy_load_manifests(framework_slug, manifests)
+
+    # a single read-only copy of primary_cl is shared between all threads/contexts in the process
+    return SharedContentLoader(primary_cl)
+
+
+content_loader = _make_content_loader()
 
-    # seal primary_cl in a closure by returning a function which will only ever return an independent copy of it
-    return lambda: deepcopy(primary_cl)
 
-
-_content_loader_factory = _make_content_loader_factory()
-
-
-@logged_duration(message="Spent {duration_real}s in get_content_loader")
-def get_content_loader():
-    if not hasattr(_local, "content_loader"):
-        _local.content_loader = _content_loader_factory()
-    return _local.content_loader
-
-
-content_loader = LocalProxy(get_content_loader)
+main.before_request(partial(require_login, role='supplier'))
 
 
-main.before_request(partial(require_login, role='supplier'))
+@main.record_once
+def preload_content_manifests(state):
+    content_loader.load_manifests(state.app.config['DM_CONTENT_PRELOAD_MANIFESTS'])
+
+
+@main.record_once
+def watch_content_for_changes(state):
+    if state.app.config['DM_CONTENT_RELOAD_INTERVAL']:
+        content_loader.watch_for_changes(CONTENT_MANIFESTS, state.app.config['DM_CONTENT_RELOAD_INTERVAL'])
+
+
+@main.record_once
+def configure_caches(state):
+    filtered_manifest_cache.configure(maxsize=state.app.config['DM_FILTERED_MANIFEST_CACHE_SIZE'])
+    brief_summary_cache.configure(
+        maxsize=state.app.config['DM_BRIEF_SUMMARY_CACHE_SIZE'],
+        ttl=state.app.config['DM_BRIEF_SUMMARY_CACHE_TTL'],
+    )
+    framework_cache.configure(
+        maxsize=state.app.config['DM_FRAMEWORK_CACHE_SIZE'],
+        ttl=state.app.config['DM_FRAMEWORK_CACHE_TTL'],
+        stale_ttl=state.app.config['DM_FRAMEWORK_CACHE_STALE_TTL'],
+        stale_if_error_ttl=state.app.config['DM_FRAMEWORK_CACHE_STALE_IF_ERROR_TTL'],
+    )
+    supplier_eligibility_cache.configure(
+        maxsize=state.app.config['DM_SUPPLIER_ELIGIBILITY_CACHE_SIZE'],
+        ttl=state.app.config['DM_SUPPLIER_ELIGIBILITY_CACHE_TTL'],
+    )
+    supplier_services_cache.configure(
+        maxsize=state.app.config['DM_SUPPLIER_SERVICES_CACHE_SIZE'],
+        ttl=state.app.config['DM_SUPPLIER_SERVICES_CACHE_TTL'],
+    )
+    brief_fetches.configure(window=state.app.config['DM_BRIEF_FETCH_COALESCING_WINDOW'])
+    brief_cache.configure(
+        maxsize=state.app.config['DM_BRIEF_CACHE_SIZE'],
+        stale_if_error_ttl=state.app.config['DM_BRIEF_CACHE_STALE_IF_ERROR_TTL'],
+    )
+    opportunities_dashboard_cache.configure(
+        maxsize=state.app.config['DM_OPPORTUNITIES_DASHBOARD_CACHE_SIZE'],
+        ttl=state.app.config['DM_OPPORTUNITIES_DASHBOARD_CACHE_TTL'],
+    )
+    data_api_circuit_breaker.configure(
+        failure_threshold=state.app.config['DM_DATA_API_CIRCUIT_BREAKER_THRESHOLD'],
+        reset_timeout=state.app.config['DM_DATA_API_CIRCUIT_BREAKER_RESET_TIMEOUT'],
+    )
 
 
 @main.after_request
@@ -6,6 +6,7 @@ from dmutils.errors import render_error_page
 
 @main.app_errorhandler(APIError)
 def api_error_handler(e):
+    # cached lookups (see StaleWhileRevalidateCache) only let API errors through when they have nothing usable to serve
     return render_error_page(status_code=e.status_code)
 
 
@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
 
+from copy import deepcopy
+from time import perf_counter
+
 import six
 
 from flask import abort, current_app, escape, url_for
@@ -12,12 +15,31 @@ from dmutils.email.helpers import hash_string
 from dmutils.env_helpers import get_web_url_from_stage
 from dmutils.formats import dateformat
 
+from ...cache import LRUCache, SingleFlight, StaleWhileRevalidateCache
+from ...data_api import data_api_circuit_breaker
+from ...metrics import BRIEF_RESPONSE_SAVES_SKIPPED_TOTAL, SUPPLIER_ELIGIBILITY_SAVED_SECONDS_TOTAL
+
+
+# window set from DM_BRIEF_FETCH_COALESCING_WINDOW when the app is created
+brief_fetches = SingleFlight('briefs')
+
+# configured from the DM_BRIEF_CACHE_* settings when the app is created - briefs are always fetched, but the last one
+# fetched is served if the API is unavailable
+brief_cache = StaleWhileRevalidateCache('briefs', data_api_circuit_breaker, ttl=0)
+
 
 def get_brief(data_api_client, brief_id, allowed_statuses=None):
+    """Return the brief, sharing the API call with any other threads fetching the same brief at the same time.
+
+    If the API can't be reached a recently fetched copy of the brief is returned instead.
+    """
     if allowed_statuses is None:
         allowed_statuses = []
 
-    brief = data_api_client.get_brief(brief_id)['briefs']
+    brief = deepcopy(brief_fetches.do(
+        brief_id,
+        lambda: brief_cache.get_or_fetch(brief_id, lambda: data_api_client.get_brief(brief_id)['briefs']),
+    ))
 
     if allowed_statuses and brief['status'] not in allowed_statuses:
         abort(404)
@@ -25,8 +47,98 @@ def get_brief(data_api_client, brief_id, allowed_statuses=None):
     return brief
 
 
+def save_brief_response_changes(data_api_client, brief_response_id, question_ids, data, updated_by, **kwargs):
+    """Update the brief response with just those answers in `data` which differ from the ones it has in the API.
+
+    The answers are compared with the brief response as fetched from the API during this request - the data API client
+    remembers it for the rest of the request, so this won't usually fetch it again - never a copy kept from an earlier
+    one. If it already answers every one of `question_ids` (the questions on the page) and nothing has changed, those
+    answers were validated when they were saved, so the update (and its audit event) is skipped and counted in
+    `brief_response_saves_skipped_total`. Otherwise the update is made even with no changes, so the API still tells us
+    about missing answers. Returns the API response, or None if nothing was sent.
+    """
+    brief_response = data_api_client.get_brief_response(brief_response_id)['briefResponses']
+    changes = {
+        key: value for key, value in data.items()
+        if key not in brief_response or brief_response[key] != value
+    }
+    if not changes and all(question_id in brief_response for question_id in question_ids):
+        BRIEF_RESPONSE_SAVES_SKIPPED_TOTAL.inc()
+        return None
+
+    return data_api_client.update_brief_response(brief_response_id, changes, updated_by, **kwargs)
+
+
+# sized from DM_SUPPLIER_ELIGIBILITY_CACHE_SIZE and DM_SUPPLIER_ELIGIBILITY_CACHE_TTL when the app is created
+supplier_eligibility_cache = LRUCache('supplier_eligibility')
+
+
 def is_supplier_eligible_for_brief(data_api_client, supplier_id, brief):
-    return data_api_client.is_supplier_eligible_for_brief(supplier_id, brief['id'])
+    """Whether the supplier can apply for the brief.
+
+    Answers are cached for a short time, as they hardly ever change while a supplier is working through the brief
+    response pages. Each time the cache saves us asking the API, the time the API took to answer is added to
+    `supplier_eligibility_saved_seconds_total`.
+    """
+    key = (supplier_id, brief['id'])
+    cached = supplier_eligibility_cache.get(key)
+    if cached is not None:
+        eligible, duration = cached
+        SUPPLIER_ELIGIBILITY_SAVED_SECONDS_TOTAL.inc(duration)
+        return eligible
+
+    start = perf_counter()
+    eligible = data_api_client.is_supplier_eligible_for_brief(supplier_id, brief['id'])
+    supplier_eligibility_cache.set(key, (eligible, perf_counter() - start))
+
+    return eligible
+
+
+def invalidate_supplier_eligibility(supplier_id, brief_id):
+    """Forget whether the supplier can apply for the brief, eg after something which could change that"""
+    supplier_eligibility_cache.delete((supplier_id, brief_id))
+
+
+# sized from DM_SUPPLIER_SERVICES_CACHE_SIZE and DM_SUPPLIER_SERVICES_CACHE_TTL when the app is created
+supplier_services_cache = LRUCache('supplier_services')
+
+
+class SupplierServices(object):
+    """A supplier's published services on a framework, indexed by lot and by the specialist roles offered on each lot"""
+
+    def __init__(self, services):
+        self._roles_by_lot = {}
+        for service in services:
+            roles = self._roles_by_lot.setdefault(service.get('lotSlug', service.get('lot')), {})
+            for key in service:
+                if key.endswith('PriceMax'):
+                    roles.setdefault(key[:-len('PriceMax')], service)
+
+    def __bool__(self):
+        return bool(self._roles_by_lot)
+
+    def has_lot(self, lot_slug):
+        return lot_slug in self._roles_by_lot
+
+    def max_day_rate(self, lot_slug, role):
+        service = self._roles_by_lot.get(lot_slug, {}).get(role)
+        return None if service is None else service[role + 'PriceMax']
+
+
+def get_supplier_services(data_api_client, supplier_id, framework_slug):
+    """Return the supplier's published services on the framework as `SupplierServices`, cached for a short time.
+
+    All lots are fetched together, so any question about the supplier's services for a brief can be answered from the
+    one call. Suppliers have at most a service per lot on the frameworks with briefs, so they all fit on the first page.
+    """
+    def fetch_supplier_services():
+        return SupplierServices(data_api_client.find_services(
+            supplier_id=supplier_id,
+            framework=framework_slug,
+            status="published",
+        )["services"])
+
+    return supplier_services_cache.get_or_set((supplier_id, framework_slug), fetch_supplier_services)
 
 
 def send_brief_clarification_question(data_api_client, brief, clarification_question):
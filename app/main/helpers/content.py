@@ -0,0 +1,519 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import io
+import json
+import logging
+import os
+import pickle
+from copy import deepcopy
+from threading import Lock
+from time import monotonic
+from weakref import WeakKeyDictionary
+
+from flask import current_app
+from dmcontent.content_loader import ContentLoader, ContentManifest
+from dmcontent.utils import TemplateField
+from dmutils.timing import logged_duration
+
+from ...cache import LRUCache
+from ...metrics import (
+    CONTENT_LOADER_COPIES_TOTAL,
+    CONTENT_LOADER_COPY_DURATION_SECONDS,
+    CONTENT_MANIFEST_RELOADS_TOTAL,
+)
+
+
+class SharedContentLoader(object):
+    """A read-only view of a fully loaded ContentLoader which can be shared between threads.
+
+    The wrapped loader is copied once when the view is created, so nothing holding a reference to the original can
+    change what we serve. Manifests are only ever handed out as fresh ContentManifest objects built over the shared
+    (and never mutated) raw section data, so filtering and other per-request transformations can't leak between
+    requests.
+
+    As there is only ever the one copy per process, memory use doesn't grow with the number of threads a server
+    decides to run. `content_loader_copies_total` on the metrics endpoint should stay at one per process.
+
+    Manifests registered with `ContentLoader.lazy_load_manifests` are loaded on first use. Loading is serialised by a
+    lock (the YAML and markdown processing behind it isn't threadsafe), but once a manifest is loaded it is served
+    without any locking.
+
+    Loaded manifests can also be reloaded when their files change (see `watch_for_changes`). A reloaded manifest is
+    swapped in whole, so anything already holding the old version keeps a consistent view of it.
+    """
+
+    def __init__(self, content_loader):
+        with CONTENT_LOADER_COPY_DURATION_SECONDS.time():
+            self._content_loader = deepcopy(content_loader)
+        CONTENT_LOADER_COPIES_TOTAL.inc()
+
+        self._load_lock = Lock()
+        self._loaded_manifests = set()
+
+        self._reload_lock = Lock()
+        self._watched_manifests = None
+        self._reload_interval = None
+        self._next_reload_check = None
+        self._manifest_hashes = {}
+        self._manifest_versions = {}
+
+    def get_manifest(self, framework_slug, manifest):
+        self.check_for_changes()
+        if (framework_slug, manifest) not in self._loaded_manifests:
+            self.load_manifest(framework_slug, manifest)
+        return self._content_loader.get_manifest(framework_slug, manifest)
+
+    def get_manifest_version(self, framework_slug, manifest):
+        """Return a number which changes whenever the manifest is reloaded, for use in cache keys"""
+        return self._manifest_versions.get((framework_slug, manifest), 0)
+
+    def load_manifest(self, framework_slug, manifest):
+        with self._load_lock:
+            if (framework_slug, manifest) in self._loaded_manifests:
+                return
+
+            # hash the files before loading them, so a change made while we're loading is picked up by the next check
+            if self._watched_manifests is not None and (framework_slug, manifest) in self._watched_manifests:
+                self._manifest_hashes[(framework_slug, manifest)] = self._manifest_hash(framework_slug, manifest)
+
+            with logged_duration(
+                message="Spent {duration_real}s loading {framework_slug} {manifest} manifest"
+            ) as log_context:
+                log_context.update(framework_slug=framework_slug, manifest=manifest)
+                # the first access to a lazily loaded manifest is what causes it to be loaded
+                self._content_loader.get_manifest(framework_slug, manifest)
+
+            self._loaded_manifests.add((framework_slug, manifest))
+
+    def load_manifests(self, manifests):
+        for framework_slug, manifest in manifests:
+            self.load_manifest(framework_slug, manifest)
+
+    def watch_for_changes(self, content_manifests, interval):
+        """Reload any loaded manifest from `content_manifests` whose files change, checking every `interval` seconds.
+
+        Checks are made by whichever request asks for a manifest once `interval` has passed, and only one thread
+        checks at a time - everyone else carries on with the manifests they already have.
+        """
+        with self._load_lock:
+            self._watched_manifests = {
+                (framework_slug, manifest): question_set
+                for framework_slug, manifest_question_sets in content_manifests.items()
+                for manifest, question_set in manifest_question_sets.items()
+            }
+            self._manifest_hashes = {
+                key: self._manifest_hash(*key) for key in self._loaded_manifests if key in self._watched_manifests
+            }
+            self._reload_interval = interval
+            self._next_reload_check = monotonic() + interval
+
+    def reload_changed_manifests(self):
+        """Reload every watched manifest whose files have changed since it was loaded"""
+        with self._load_lock:
+            for (framework_slug, manifest), loaded_hash in list(self._manifest_hashes.items()):
+                current_hash = self._manifest_hash(framework_slug, manifest)
+                if current_hash == loaded_hash:
+                    continue
+
+                try:
+                    # a fresh loader, as ContentLoader caches the questions it has read
+                    sections = ContentLoader(self._content_loader.content_path).generate_manifest(
+                        framework_slug, self._watched_manifests[(framework_slug, manifest)], manifest
+                    )
+                except Exception:
+                    # most likely a file caught half written - keep serving what we have and try again next time
+                    logger.exception("Failed to reload %s %s manifest", framework_slug, manifest)
+                    continue
+
+                self._content_loader._content[framework_slug][manifest] = sections
+                self._manifest_hashes[(framework_slug, manifest)] = current_hash
+                self._manifest_versions[(framework_slug, manifest)] = (
+                    self.get_manifest_version(framework_slug, manifest) + 1
+                )
+                CONTENT_MANIFEST_RELOADS_TOTAL.labels(framework_slug, manifest).inc()
+                logger.info("Reloaded %s %s manifest", framework_slug, manifest)
+
+    def check_for_changes(self):
+        """Reload changed manifests if we're watching for changes and `interval` has passed since the last check.
+
+        Call this before `get_manifest_version` when building a cache key, so the key reflects any reload.
+        """
+        if self._watched_manifests is None:
+            return
+        if monotonic() < self._next_reload_check or not self._reload_lock.acquire(blocking=False):
+            return
+
+        try:
+            self._next_reload_check = monotonic() + self._reload_interval
+            self.reload_changed_manifests()
+        finally:
+            self._reload_lock.release()
+
+    def _manifest_hash(self, framework_slug, manifest):
+        return manifest_hash(
+            self._content_loader.content_path,
+            framework_slug,
+            self._watched_manifests[(framework_slug, manifest)],
+            manifest,
+        )
+
+
+CONTENT_BUNDLE_VERSION = 1
+
+logger = logging.getLogger(__name__)
+
+
+class BundledContentLoader(ContentLoader):
+    """A ContentLoader which takes manifests from a prebuilt content bundle, falling back to the YAML files for any
+    manifest the bundle doesn't have.
+
+    `bundle` is the mapping returned by `read_content_bundle`.
+    """
+
+    def __init__(self, content_path, bundle=None):
+        super().__init__(content_path)
+        self._bundle = bundle or {}
+
+    def generate_manifest(self, framework_slug, question_set, manifest):
+        if (framework_slug, manifest) in self._bundle:
+            return pickle.loads(self._bundle[(framework_slug, manifest)])
+        return super().generate_manifest(framework_slug, question_set, manifest)
+
+
+def _reduce_template_field(field):
+    # compiled templates can't be pickled, so TemplateFields are rebuilt from their source when the bundle is loaded
+    return TemplateField, (field.source, field.markdown)
+
+
+def _dump_manifest(manifest_sections):
+    data = io.BytesIO()
+    pickler = pickle.Pickler(data, protocol=pickle.HIGHEST_PROTOCOL)
+    pickler.dispatch_table = {TemplateField: _reduce_template_field}
+    pickler.dump(manifest_sections)
+    return data.getvalue()
+
+
+def _hash_file(digest, content_path, file_path):
+    digest.update(os.path.relpath(file_path, content_path).encode('utf-8'))
+    with open(file_path, 'rb') as f:
+        digest.update(f.read())
+
+
+def _hash_directory(digest, content_path, path):
+    for directory, directory_names, file_names in os.walk(path):
+        directory_names.sort()
+        for file_name in sorted(file_names):
+            _hash_file(digest, content_path, os.path.join(directory, file_name))
+
+
+def content_hash(content_path, content_manifests):
+    """Return a hash of the manifest and question files used by `content_manifests`"""
+    digest = hashlib.sha256()
+    for framework_slug in sorted(content_manifests):
+        framework_path = os.path.join(content_path, 'frameworks', framework_slug)
+        paths = [os.path.join(framework_path, 'manifests')] + [
+            os.path.join(framework_path, 'questions', question_set)
+            for question_set in sorted(set(content_manifests[framework_slug].values()))
+        ]
+        for path in paths:
+            _hash_directory(digest, content_path, path)
+
+    return digest.hexdigest()
+
+
+def manifest_hash(content_path, framework_slug, question_set, manifest):
+    """Return a hash of the files a single manifest is loaded from"""
+    digest = hashlib.sha256()
+    framework_path = os.path.join(content_path, 'frameworks', framework_slug)
+    manifest_path = os.path.join(framework_path, 'manifests', '{}.yml'.format(manifest))
+    if os.path.exists(manifest_path):
+        _hash_file(digest, content_path, manifest_path)
+    _hash_directory(digest, content_path, os.path.join(framework_path, 'questions', question_set))
+
+    return digest.hexdigest()
+
+
+def write_content_bundle(bundle_path, content_path, content_manifests):
+    """Load every manifest in `content_manifests` from the YAML in `content_path` and save them as a content bundle"""
+    content_loader = ContentLoader(content_path)
+    manifests = {
+        (framework_slug, manifest): _dump_manifest(
+            content_loader.generate_manifest(framework_slug, question_set, manifest)
+        )
+        for framework_slug, manifest_question_sets in content_manifests.items()
+        for manifest, question_set in manifest_question_sets.items()
+    }
+
+    with open(bundle_path, 'wb') as f:
+        pickle.dump({
+            'version': CONTENT_BUNDLE_VERSION,
+            'content_hash': content_hash(content_path, content_manifests),
+            'manifests': manifests,
+        }, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def read_content_bundle(bundle_path, content_path, content_manifests):
+    """Return the manifests from the content bundle at `bundle_path`, or None if it is missing or stale"""
+    try:
+        with open(bundle_path, 'rb') as f:
+            bundle = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        logger.warning("Ignoring unreadable content bundle at %s", bundle_path, exc_info=True)
+        return None
+
+    if bundle.get('version') != CONTENT_BUNDLE_VERSION:
+        logger.warning("Ignoring content bundle at %s built by a different version of the app", bundle_path)
+        return None
+
+    if bundle.get('content_hash') != content_hash(content_path, content_manifests):
+        logger.warning("Ignoring content bundle at %s which doesn't match the content files", bundle_path)
+        return None
+
+    return bundle['manifests']
+
+
+# sized from DM_FILTERED_MANIFEST_CACHE_SIZE when the app is created
+filtered_manifest_cache = LRUCache('filtered_manifests')
+
+
+def brief_version(brief):
+    """Return a value which changes whenever anything in `brief` does.
+
+    `updatedAt` alone isn't enough, as some changes (like a brief closing for applications) don't touch it.
+    """
+    return (
+        brief.get('updatedAt'),
+        hashlib.sha1(json.dumps(brief, sort_keys=True, default=str).encode('utf-8')).hexdigest(),
+    )
+
+
+def get_filtered_brief_manifest(content_loader, manifest, brief, lot_slug, **context):
+    """Return the `manifest` for the brief's framework filtered for `brief` and `lot_slug`.
+
+    Any other `context` needed for filtering can be passed as keyword arguments. Filtered manifests are cached in
+    `filtered_manifest_cache` until the brief or the manifest changes, so must be treated as read-only.
+    """
+    content_loader.check_for_changes()
+    key = (
+        brief['frameworkSlug'],
+        manifest,
+        content_loader.get_manifest_version(brief['frameworkSlug'], manifest),
+        lot_slug,
+        brief['id'],
+        brief_version(brief),
+        tuple(sorted(context.items())),
+    )
+
+    return filtered_manifest_cache.get_or_set(
+        key,
+        lambda: content_loader.get_manifest(brief['frameworkSlug'], manifest).filter(
+            dict(context, lot=lot_slug, brief=brief)
+        ),
+    )
+
+
+# sized from DM_BRIEF_SUMMARY_CACHE_SIZE and DM_BRIEF_SUMMARY_CACHE_TTL when the app is created
+brief_summary_cache = LRUCache('brief_summaries')
+
+
+def get_brief_summary(content_loader, brief, lot_slug):
+    """Return the summary of the brief's questions and answers for `lot_slug`.
+
+    Summaries are cached until the brief changes. Briefs which are no longer live won't change again, so their
+    summaries are kept for much longer than those of live briefs.
+    """
+    content_loader.check_for_changes()
+    key = (
+        brief['frameworkSlug'],
+        content_loader.get_manifest_version(brief['frameworkSlug'], 'edit_brief'),
+        lot_slug,
+        brief['id'],
+        brief_version(brief),
+    )
+    ttl = None if brief.get('status') == 'live' else current_app.config['DM_CLOSED_BRIEF_SUMMARY_CACHE_TTL']
+
+    return brief_summary_cache.get_or_set(
+        key,
+        lambda: content_loader.get_manifest(brief['frameworkSlug'], 'edit_brief').filter({'lot': lot_slug}).summary(
+            brief
+        ),
+        ttl=ttl,
+    )
+
+
+def is_skipped_question(question_id, brief):
+    """Whether a question is left out of the brief response flow because the brief doesn't ask it.
+
+    If a question in a brief is optional and is unanswered by the buyer, the brief will have the key but will have no
+    data. This is specifically for nice to have requirements, and works because briefs and responses share the same
+    key for this question/response.
+    """
+    return question_id in brief and not brief[question_id]
+
+
+class QuestionNavigation(object):
+    """The order of the questions in a section of the brief response flow, with skipped questions left out.
+
+    Built once per filtered section (see `get_question_navigation`) so finding the next or previous question, or a
+    question's position in the flow, is a dictionary lookup.
+    """
+
+    def __init__(self, section, brief):
+        question_ids = [question.id for question in section.questions]
+        self.question_ids = [
+            question_id for question_id in question_ids if not is_skipped_question(question_id, brief)
+        ]
+
+        self._positions = {question_id: index for index, question_id in enumerate(self.question_ids, 1)}
+        self._previous_question_ids = {}
+        self._next_question_ids = {}
+
+        previous_question_id = None
+        for question_id in question_ids:
+            self._previous_question_ids[question_id] = previous_question_id
+            if question_id in self._positions:
+                previous_question_id = question_id
+
+        next_question_id = None
+        for question_id in reversed(question_ids):
+            self._next_question_ids[question_id] = next_question_id
+            if question_id in self._positions:
+                next_question_id = question_id
+
+    def get_next_question_id(self, question_id=None):
+        """Return the id of the question after `question_id`, or the first question if `question_id` is None"""
+        if question_id is None:
+            return self.question_ids[0] if self.question_ids else None
+        return self._next_question_ids.get(question_id)
+
+    def get_previous_question_id(self, question_id):
+        return self._previous_question_ids.get(question_id)
+
+    def is_last_question(self, question_id):
+        return self.get_next_question_id(question_id) is None
+
+    def get_position(self, question_id):
+        """Return a (question number, number of questions) pair, eg for a "question 2 of 5" progress indicator"""
+        if question_id not in self._positions:
+            return None
+        return self._positions[question_id], len(self.question_ids)
+
+
+class _ContentObjectCache(object):
+    """Values derived from a content object (eg a filtered manifest or section), kept for as long as that object is.
+
+    For cached manifests (see `get_filtered_brief_manifest`) that means until the brief changes.
+    """
+
+    def __init__(self):
+        self._values = WeakKeyDictionary()
+        self._lock = Lock()
+
+    def get_or_set(self, content_object, make_value):
+        with self._lock:
+            value = self._values.get(content_object)
+            if value is None:
+                value = self._values[content_object] = make_value()
+        return value
+
+
+_question_navigations = _ContentObjectCache()
+
+
+def get_question_navigation(section, brief):
+    """Return the QuestionNavigation for a filtered `section`, which must already have been filtered for `brief`"""
+    return _question_navigations.get_or_set(section, lambda: QuestionNavigation(section, brief))
+
+
+def _question_field_names(question):
+    # every name `question.get_question` can match: its own id, the ids of any nested questions (multiquestions and
+    # dynamic lists) and any pricing fields
+    yield question.id
+    for nested_question in vars(question).get('questions', []):
+        yield nested_question.id
+    yield from vars(question).get('fields', {}).values()
+
+
+class ContentIndex(object):
+    """Lookups by id for the sections and questions in a filtered manifest.
+
+    Built once per manifest (see `get_content_index`) so that finding a question is a dictionary lookup rather than a
+    scan through every section and question.
+    """
+
+    def __init__(self, content):
+        self.next_editable_section = content.get_section(content.get_next_editable_section_id())
+
+        self._sections = {}
+        self._questions = {}
+        self._section_questions = {}
+        for section in content:
+            self._sections.setdefault(section.id, section)
+            section_questions = self._section_questions.setdefault(section.id, {})
+            for question in section.questions:
+                for field_name in _question_field_names(question):
+                    field_question = question.get_question(field_name)
+                    if field_name not in section_questions and field_question is not None:
+                        section_questions[field_name] = field_question
+                        self._questions.setdefault(field_name, (field_question, section))
+
+    def get_section(self, section_id):
+        return self._sections.get(section_id)
+
+    def get_question(self, question_id, section=None):
+        """Return the question (or the question containing the field) `question_id`, optionally only from `section`"""
+        if section is None:
+            return self._questions.get(question_id, (None, None))[0]
+        return self._section_questions.get(section.id, {}).get(question_id)
+
+    def get_question_section(self, question_id):
+        return self._questions.get(question_id, (None, None))[1]
+
+
+_content_indexes = _ContentObjectCache()
+
+
+def get_content_index(content):
+    """Return the ContentIndex for a filtered manifest"""
+    return _content_indexes.get_or_set(content, lambda: ContentIndex(content))
+
+
+def _copy_question(question):
+    # `copy.copy` trips over Question.__getattr__, so copy the instance attributes ourselves
+    question_copy = object.__new__(question.__class__)
+    question_copy.__dict__.update(question.__dict__)
+    return question_copy
+
+
+def inject_brief_questions(content, brief):
+    """Return `content` with the brief's questions injected into any boolean_list questions.
+
+    Unlike `ContentSection.inject_brief_questions_into_boolean_list_question` this leaves `content` untouched. Only
+    the sections and questions which change are copied - everything else is shared with `content`.
+    """
+    sections = []
+    for section in content:
+        if any(question.type == 'boolean_list' for question in section.questions):
+            section = section.copy()
+            section.questions = [
+                _copy_question(question) if question.type == 'boolean_list' else question
+                for question in section.questions
+            ]
+            section.inject_brief_questions_into_boolean_list_question(brief)
+        sections.append(section)
+    return ContentManifest(sections)
+
+
+_brief_question_overlays = _ContentObjectCache()
+
+
+def get_brief_response_display_manifest(content_loader, manifest, brief, lot_slug):
+    """Return the display `manifest` for responses to `brief`, filtered and with the brief's questions injected.
+
+    Like the filtered manifest it's built from (see `get_filtered_brief_manifest`) it is cached until the brief
+    changes, so must be treated as read-only.
+    """
+    content = get_filtered_brief_manifest(content_loader, manifest, brief, lot_slug)
+    return _brief_question_overlays.get_or_set(content, lambda: inject_brief_questions(content, brief))
@@ -1,26 +1,110 @@
 # -*- coding: utf-8 -*-
-from flask import abort
+from uuid import uuid4
 
+from flask import abort, session
 
-def get_framework(client, framework_slug, allowed_statuses=None):
+from ...cache import LRUCache, StaleWhileRevalidateCache
+from ...data_api import data_api_circuit_breaker
+
+
+# configured from the DM_FRAMEWORK_CACHE_* settings when the app is created - stale frameworks are served while they're
+# refreshed, or if the API is unavailable
+framework_cache = StaleWhileRevalidateCache('frameworks', data_api_circuit_breaker)
+
+
+def invalidate_framework(framework_slug=None):
+    """Forget the cached `framework_slug` framework, or every cached framework if no slug is given"""
+    if framework_slug is None:
+        framework_cache.clear()
+    else:
+        framework_cache.delete(framework_slug)
+
+
+# sized from DM_OPPORTUNITIES_DASHBOARD_CACHE_SIZE and DM_OPPORTUNITIES_DASHBOARD_CACHE_TTL when the app is created -
+# each supplier's interest in a framework and their brief responses on it, as returned by the API
+opportunities_dashboard_cache = LRUCache('opportunities_dashboard')
+
+
+def get_supplier_opportunities(data_api_client, supplier_id, framework_slug, statuses):
+    """Return the supplier's interest in the framework and their brief responses on it with one of `statuses` (without
+    their data), as returned by the API. Brief responses aren't fetched if the supplier isn't on the framework.
+
+    They're cached for a short time under a version kept in the user's session, which changes whenever
+    `invalidate_opportunities_dashboard` is called for the framework. The session goes with the user to every instance
+    of the app, so none of them will show the user a copy from before their own changes. Cached responses are shared,
+    so mustn't be changed.
+    """
+    def fetch_supplier_opportunities():
+        supplier_framework = data_api_client.get_supplier_framework_info(
+            supplier_id=supplier_id,
+            framework_slug=framework_slug,
+        )['frameworkInterest']
+        if not supplier_framework['onFramework']:
+            return supplier_framework, []
+
+        return supplier_framework, data_api_client.find_brief_responses(
+            supplier_id=supplier_id,
+            framework=framework_slug,
+            status=",".join(statuses),
+            with_data=False,
+        )['briefResponses']
+
+    return opportunities_dashboard_cache.get_or_set(
+        _opportunities_dashboard_key(supplier_id, framework_slug),
+        fetch_supplier_opportunities,
+    )
+
+
+def invalidate_opportunities_dashboard(supplier_id, framework_slug):
+    """Forget the supplier's opportunities on the framework, eg after they've started or changed a brief response"""
+    opportunities_dashboard_cache.delete(_opportunities_dashboard_key(supplier_id, framework_slug))
+    session['opportunities_dashboard_versions'] = dict(
+        session.get('opportunities_dashboard_versions', {}),
+        **{framework_slug: uuid4().hex}
+    )
+
+
+def _opportunities_dashboard_key(supplier_id, framework_slug):
+    return supplier_id, framework_slug, session.get('opportunities_dashboard_versions', {}).get(framework_slug)
+
+
+def _get_framework_and_lots(client, framework_slug, allowed_statuses):
     if allowed_statuses is None:
         allowed_statuses = ['open', 'pending', 'standstill', 'live']
 
-    framework = client.get_framework(framework_slug)['frameworks']
+    # frameworks are cached along with their lots by slug, so finding a lot is a dictionary lookup
+    def fetch_framework():
+        framework = client.get_framework(framework_slug)['frameworks']
+        return framework, _lots_by_slug(framework)
+
+    framework, lots = framework_cache.get_or_fetch(framework_slug, fetch_framework)
 
     if allowed_statuses and framework['status'] not in allowed_statuses:
         abort(404)
 
+    return framework, lots
+
+
+def get_framework(client, framework_slug, allowed_statuses=None):
+    """Return the framework, which is cached for up to DM_FRAMEWORK_CACHE_TTL seconds so must be treated as read-only"""
+    framework, lots = _get_framework_and_lots(client, framework_slug, allowed_statuses)
     return framework
 
 
 def get_framework_and_lot(client, framework_slug, lot_slug, allowed_statuses=None):
-    framework = get_framework(client, framework_slug, allowed_statuses)
-    return framework, get_framework_lot(framework, lot_slug)
+    framework, lots = _get_framework_and_lots(client, framework_slug, allowed_statuses)
+    return framework, _get_lot(lots, lot_slug)
 
 
 def get_framework_lot(framework, lot_slug):
-    try:
-        return next(lot for lot in framework['lots'] if lot['slug'] == lot_slug)
-    except StopIteration:
+    return _get_lot(_lots_by_slug(framework), lot_slug)
+
+
+def _lots_by_slug(framework):
+    return {lot['slug']: lot for lot in framework.get('lots', [])}
+
+
+def _get_lot(lots, lot_slug):
+    if lot_slug not in lots:
         abort(404)
+    return lots[lot_slug]
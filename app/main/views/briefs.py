@@ -11,13 +11,24 @@ from dmutils.forms.errors import govuk_errors
 
 from ..helpers.briefs import (
     get_brief,
+    get_supplier_services,
     is_supplier_eligible_for_brief,
-    send_brief_clarification_question
+    save_brief_response_changes,
+    send_brief_clarification_question,
 )
-from ..helpers.frameworks import get_framework_and_lot
+from ..helpers.content import (
+    get_brief_response_display_manifest,
+    get_brief_summary,
+    get_content_index,
+    get_filtered_brief_manifest,
+    get_question_navigation,
+    is_skipped_question,
+)
+from ..helpers.frameworks import get_framework_and_lot, invalidate_opportunities_dashboard
 from ..helpers.briefs import is_legacy_brief_response
 from ...main import main, public, content_loader
 from ... import data_api_client
+from ...data_api import fetch_concurrently
 from ..forms.briefs import AskClarificationQuestionForm
 
 PUBLISHED_BRIEF_STATUSES = ['live', 'closed', 'awarded', 'cancelled', 'unsuccessful', 'withdrawn']
@@ -99,6 +110,7 @@ def start_brief_response(brief_id):
                 {},
                 current_user.email_address,
             )['briefResponses']
+            invalidate_opportunities_dashboard(current_user.supplier_id, brief['frameworkSlug'])
             brief_response_id = brief_response['id']
             return redirect(url_for('.edit_brief_response', brief_id=brief_id, brief_response_id=brief_response_id))
 
@@ -126,48 +138,49 @@ def start_brief_response(brief_id):
 def edit_brief_response(brief_id, brief_response_id, question_id=None):
     edit_single_question_flow = request.endpoint.endswith('.edit_single_question')
 
-    brief = get_brief(data_api_client, brief_id, allowed_statuses=['live'])
-    brief_response = data_api_client.get_brief_response(brief_response_id)['briefResponses']
+    supplier_id = current_user.supplier_id
+    # the brief response is fetched first, on this thread, so it's remembered for saving changes to it
+    brief_response, brief = fetch_concurrently(
+        lambda: data_api_client.get_brief_response(brief_response_id)['briefResponses'],
+        lambda: get_brief(data_api_client, brief_id, allowed_statuses=['live']),
+    )
 
-    if brief_response['briefId'] != brief['id'] or brief_response['supplierId'] != current_user.supplier_id:
+    if brief_response['briefId'] != brief['id'] or brief_response['supplierId'] != supplier_id:
         abort(404)
 
-    if not is_supplier_eligible_for_brief(data_api_client, current_user.supplier_id, brief):
-        return _render_not_eligible_for_brief_error_page(brief)
+    role = brief.get('specialistRole')
+    is_eligible, (framework, lot), supplier_services = fetch_concurrently(
+        lambda: is_supplier_eligible_for_brief(data_api_client, supplier_id, brief),
+        lambda: get_framework_and_lot(
+            data_api_client, brief['frameworkSlug'], brief['lotSlug'], allowed_statuses=['live', 'expired']
+        ),
+        lambda: get_supplier_services(data_api_client, supplier_id, brief['frameworkSlug']) if role else None,
+    )
 
-    framework, lot = get_framework_and_lot(
-        data_api_client, brief['frameworkSlug'], brief['lotSlug'], allowed_statuses=['live', 'expired'])
+    if not is_eligible:
+        return _render_not_eligible_for_brief_error_page(brief)
 
     max_day_rate = None
-    role = brief.get('specialistRole')
     if role:
-        brief_service = data_api_client.find_services(
-            supplier_id=current_user.supplier_id,
-            framework=brief['frameworkSlug'],
-            status="published",
-            lot=brief["lotSlug"],
-        )["services"][0]
-        max_day_rate = brief_service.get(role + "PriceMax")
-
-    content = content_loader.get_manifest(
-        brief['frameworkSlug'], 'edit_brief_response'
-    ).filter({'lot': lot['slug'], 'brief': brief, 'max_day_rate': max_day_rate})
-
-    section = content.get_section(content.get_next_editable_section_id())
+        max_day_rate = supplier_services.max_day_rate(brief['lotSlug'], role)
+
+    content = get_filtered_brief_manifest(
+        content_loader, 'edit_brief_response', brief, lot['slug'], max_day_rate=max_day_rate
+    )
+
+    content_index = get_content_index(content)
+    section = content_index.next_editable_section
     if section is None or not section.editable:
         abort(404)
 
-    # If a question in a brief is optional and is unanswered by the buyer, the brief will have the key but will have no
-    # data. The question will be skipped in the brief response flow (see below). If a user attempts to access the
-    # question by directly visiting the url, this check will return a 404. It has been created specifically for nice to
-    # have requirements, and works because briefs and responses share the same key for this question/response.
-    if question_id in brief.keys() and not brief[question_id]:
+    # Questions the brief doesn't ask (nice to have requirements, if the buyer didn't give any) are skipped in the brief
+    # response flow. If a user attempts to access the question by directly visiting the url, this check will return a
+    # 404.
+    if is_skipped_question(question_id, brief):
         abort(404)
 
-    # If a question is to be skipped in the normal flow (due to the reason above), we update the next_question_id.
-    next_question_id = section.get_next_question_id(question_id)
-    if next_question_id in brief.keys() and not brief[next_question_id]:
-        next_question_id = section.get_next_question_id(next_question_id)
+    navigation = get_question_navigation(section, brief)
+    next_question_id = navigation.get_next_question_id(question_id)
 
     def redirect_to_next_page():
         return redirect(url_for(
@@ -181,7 +194,7 @@ def edit_brief_response(brief_id, brief_response_id, question_id=None):
     if question_id is None:
         return redirect_to_next_page()
 
-    question = section.get_question(question_id)
+    question = content_index.get_question(question_id, section)
     if question is None:
         abort(404)
 
@@ -192,8 +205,10 @@ def edit_brief_response(brief_id, brief_response_id, question_id=None):
     errors = {}
     if request.method == 'POST':
         try:
-            data_api_client.update_brief_response(
+            saved = save_brief_response_changes(
+                data_api_client,
                 brief_response_id,
+                question.get_question_ids(),
                 question.get_data(request.form),
                 current_user.email_address,
                 page_questions=[question.id]
@@ -205,6 +220,8 @@ def edit_brief_response(brief_id, brief_response_id, question_id=None):
             service_data = question.unformat_data(question.get_data(request.form))
 
         else:
+            if saved is not None:
+                invalidate_opportunities_dashboard(supplier_id, brief['frameworkSlug'])
             if next_question_id and not edit_single_question_flow:
                 return redirect_to_next_page()
             else:
@@ -214,10 +231,7 @@ def edit_brief_response(brief_id, brief_response_id, question_id=None):
                     url_for('.check_brief_response_answers', brief_id=brief_id, brief_response_id=brief_response_id)
                 )
 
-    previous_question_id = section.get_previous_question_id(question_id)
-    # Skip previous question if the brief has no nice to have requirements
-    if previous_question_id in brief.keys() and not brief[previous_question_id]:
-        previous_question_id = section.get_previous_question_id(previous_question_id)
+    previous_question_id = navigation.get_previous_question_id(question_id)
 
     previous_question_url = None
     if previous_question_id:
@@ -232,7 +246,7 @@ def edit_brief_response(brief_id, brief_response_id, question_id=None):
         "briefs/edit_brief_response_question.html",
         brief=brief,
         errors=errors,
-        is_last_page=False if next_question_id else True,
+        is_last_page=navigation.is_last_question(question_id),
         previous_question_url=previous_question_url,
         question=question,
         service_data=service_data
@@ -241,18 +255,25 @@ def edit_brief_response(brief_id, brief_response_id, question_id=None):
 
 @main.route('/<int:brief_id>/responses/<int:brief_response_id>/application', methods=['GET', 'POST'])
 def check_brief_response_answers(brief_id, brief_response_id):
-    brief = get_brief(
-        data_api_client, brief_id, allowed_statuses=['live', 'closed', 'awarded', 'cancelled', 'unsuccessful']
+    supplier_id = current_user.supplier_id
+    brief, brief_response = fetch_concurrently(
+        lambda: get_brief(
+            data_api_client, brief_id, allowed_statuses=['live', 'closed', 'awarded', 'cancelled', 'unsuccessful']
+        ),
+        lambda: data_api_client.get_brief_response(brief_response_id)['briefResponses'],
     )
-    brief_response = data_api_client.get_brief_response(brief_response_id)['briefResponses']
-    if brief_response['briefId'] != brief['id'] or brief_response['supplierId'] != current_user.supplier_id:
+    if brief_response['briefId'] != brief['id'] or brief_response['supplierId'] != supplier_id:
         abort(404)
 
-    if not is_supplier_eligible_for_brief(data_api_client, current_user.supplier_id, brief):
-        return _render_not_eligible_for_brief_error_page(brief)
+    is_eligible, (framework, lot) = fetch_concurrently(
+        lambda: is_supplier_eligible_for_brief(data_api_client, supplier_id, brief),
+        lambda: get_framework_and_lot(
+            data_api_client, brief['frameworkSlug'], brief['lotSlug'], allowed_statuses=['live', 'expired']
+        ),
+    )
 
-    framework, lot = get_framework_and_lot(
-        data_api_client, brief['frameworkSlug'], brief['lotSlug'], allowed_statuses=['live', 'expired'])
+    if not is_eligible:
+        return _render_not_eligible_for_brief_error_page(brief)
 
     # TODO: remove the legacy flow
     if is_legacy_brief_response(brief_response):
@@ -260,11 +281,10 @@ def check_brief_response_answers(brief_id, brief_response_id):
     else:
         display_brief_response_manifest = 'display_brief_response'
 
-    response_content = content_loader.get_manifest(
-        framework['slug'], display_brief_response_manifest).filter({'lot': lot['slug'], 'brief': brief})
-    for section in response_content:
-        # TODO: remove this as boolean_list is only used in DOS1
-        section.inject_brief_questions_into_boolean_list_question(brief)
+    # TODO: remove boolean_list question injection as boolean_list is only used in DOS1
+    response_content = get_brief_response_display_manifest(
+        content_loader, display_brief_response_manifest, brief, lot['slug']
+    )
 
     error_message = None
     if request.method == 'POST':
@@ -274,6 +294,7 @@ def check_brief_response_answers(brief_id, brief_response_id):
                     brief_response_id,
                     current_user.email_address
                 )
+                invalidate_opportunities_dashboard(supplier_id, brief['frameworkSlug'])
                 if submit_response['briefResponses'].get('status') == 'draft':
                     # DB returned 200 OK but failed to update for some reason
                     error_message = 'There was a problem submitting your application.'
@@ -313,14 +334,21 @@ def check_brief_response_answers(brief_id, brief_response_id):
 
 @main.route('/<int:brief_id>/responses/result')
 def application_submitted(brief_id):
-    brief = get_brief(data_api_client, brief_id, allowed_statuses=PUBLISHED_BRIEF_STATUSES)
-    if not is_supplier_eligible_for_brief(data_api_client, current_user.supplier_id, brief):
-        return _render_not_eligible_for_brief_error_page(brief)
+    supplier_id = current_user.supplier_id
+    brief, brief_response = fetch_concurrently(
+        lambda: get_brief(data_api_client, brief_id, allowed_statuses=PUBLISHED_BRIEF_STATUSES),
+        lambda: data_api_client.find_brief_responses(brief_id=brief_id, supplier_id=supplier_id)['briefResponses'],
+    )
 
-    brief_response = data_api_client.find_brief_responses(
-        brief_id=brief_id,
-        supplier_id=current_user.supplier_id
-    )['briefResponses']
+    is_eligible, (framework, lot) = fetch_concurrently(
+        lambda: is_supplier_eligible_for_brief(data_api_client, supplier_id, brief),
+        lambda: get_framework_and_lot(
+            data_api_client, brief['frameworkSlug'], brief['lotSlug'], allowed_statuses=['live', 'expired']
+        ),
+    )
+
+    if not is_eligible:
+        return _render_not_eligible_for_brief_error_page(brief)
 
     if len(brief_response) == 0:
         # No application
@@ -333,18 +361,13 @@ def application_submitted(brief_id):
 
     # Otherwise the application is valid
     brief_response = brief_response[0]
-    framework, lot = get_framework_and_lot(
-        data_api_client, brief['frameworkSlug'], brief['lotSlug'], allowed_statuses=['live', 'expired'])
 
-    response_content = content_loader.get_manifest(
-        framework['slug'], 'display_brief_response').filter({'lot': lot['slug'], 'brief': brief})
-    for section in response_content:
-        # TODO: remove this as boolean_list is only used in DOS1
-        section.inject_brief_questions_into_boolean_list_question(brief)
+    # TODO: remove boolean_list question injection as boolean_list is only used in DOS1
+    response_content = get_brief_response_display_manifest(
+        content_loader, 'display_brief_response', brief, lot['slug']
+    )
 
-    brief_content = content_loader.get_manifest(
-        framework['slug'], 'edit_brief').filter({'lot': lot['slug']})
-    brief_summary = brief_content.summary(brief)
+    brief_summary = get_brief_summary(content_loader, brief, lot['slug'])
 
     return render_template(
         'briefs/application_submitted.html',
@@ -373,14 +396,10 @@ def redirect_to_public_opportunity_page(brief_id):
 
 
 def _render_not_eligible_for_brief_error_page(brief, clarification_question=False):
-    common_kwargs = {
-        "supplier_id": current_user.supplier_id,
-        "framework": brief['frameworkSlug'],
-        "status": "published",
-    }
-
-    if data_api_client.find_services(**common_kwargs)["services"]:
-        if data_api_client.find_services(**dict(common_kwargs, lot=brief["lotSlug"]))["services"]:
+    supplier_services = get_supplier_services(data_api_client, current_user.supplier_id, brief['frameworkSlug'])
+
+    if supplier_services:
+        if supplier_services.has_lot(brief["lotSlug"]):
             # deduce that the problem is that the roles don't match.
             reason = data_reason_slug = "supplier-not-on-role"
         else:
@@ -1,13 +1,15 @@
 # coding: utf-8
 
 from datetime import datetime, timedelta
-from flask import abort, url_for
+from math import ceil
+from flask import abort, current_app, request, url_for
 from flask_login import current_user
 from dmapiclient import APIError
 from dmutils.flask import timed_render_template as render_template
 from dmutils.formats import DATETIME_FORMAT, dateformat
 from ... import data_api_client
 from ...main import main
+from ..helpers.frameworks import get_framework, get_supplier_opportunities
 
 BRIEF_RESPONSE_STATUSES = ['draft', 'submitted', 'pending-awarded', 'awarded']
 
@@ -15,91 +17,133 @@ BRIEF_RESPONSE_STATUSES = ['draft', 'submitted', 'pending-awarded', 'awarded']
 @main.route('/frameworks/<framework_slug>', methods=['GET'])
 def opportunities_dashboard(framework_slug):
     try:
-        framework = data_api_client.get_framework(slug=framework_slug)['frameworks']
-        supplier_framework = data_api_client.get_supplier_framework_info(
-            supplier_id=current_user.supplier_id,
-            framework_slug=framework['slug']
-        )['frameworkInterest']
+        framework = get_framework(data_api_client, framework_slug, allowed_statuses=[])
+        if framework['framework'] != 'digital-outcomes-and-specialists':
+            abort(404)
+        supplier_framework, opportunities = get_supplier_opportunities(
+            data_api_client, current_user.supplier_id, framework['slug'], BRIEF_RESPONSE_STATUSES
+        )
     except APIError as e:
         abort(e.status_code)
-    if not (framework['framework'] == 'digital-outcomes-and-specialists' and supplier_framework['onFramework']):
+    if not supplier_framework['onFramework']:
         abort(404)
-    opportunities = data_api_client.find_brief_responses(
-        supplier_id=current_user.supplier_id,
-        framework=framework_slug,
-        status=",".join(BRIEF_RESPONSE_STATUSES),
-        with_data=False,
-    )['briefResponses']
-
-    # Split into two tables by status
-    drafts, completed = [], []
-    two_weeks_ago = (datetime.now() - timedelta(days=14))
 
+    drafts, completed = _split_opportunities(opportunities)
+
+    # Rows are only built for the page of each table being shown
+    drafts, drafts_pagination = _paginate(drafts, 'drafts_page')
+    completed, completed_pagination = _paginate(completed, 'completed_page')
+
+    return render_template(
+        "frameworks/opportunities_dashboard.html",
+        framework=framework,
+        completed=[_completed_row(opportunity) for opportunity in completed],
+        completed_pagination=completed_pagination,
+        drafts=[_draft_row(opportunity) for opportunity in drafts],
+        drafts_pagination=drafts_pagination,
+    ), 200
+
+
+def _split_opportunities(opportunities):
+    """Return the draft and completed opportunities to show, each in the order they're shown in"""
+    two_weeks_ago = (datetime.now() - timedelta(days=14)).strftime(DATETIME_FORMAT)
+    drafts, completed = [], []
     for opportunity in opportunities:
-        brief = opportunity.get('brief')
-        applicationsClosedAt = brief.get("applicationsClosedAt")
-
-        if opportunity['status'] == 'draft':
-            opportunity_row = [
-                {"text": brief.get('title')},
-                {"text": dateformat(applicationsClosedAt), "attributes": {"data-closed": applicationsClosedAt}},
-                {"text": "Draft"},
-            ]
-
-            # Show applications for live briefs and briefs that closed up to 2 weeks ago
-            if opportunity['brief']['status'] == 'live':
-                if opportunity.get("essentialRequirementsMet"):
-                    opportunity_url = url_for(
-                        '.check_brief_response_answers',
-                        brief_id=opportunity.get("briefId"),
-                        brief_response_id=opportunity.get("id")
-                    )
-                else:
-                    opportunity_url = url_for('.start_brief_response', brief_id=opportunity.get("briefId"))
-                opportunity_row.append(
-                    {"html": f'<a class="govuk-link" href="{opportunity_url}">Complete your application</a>'}
-                )
-                drafts.append(opportunity_row)
-            elif applicationsClosedAt > two_weeks_ago.strftime(DATETIME_FORMAT):
-                opportunity_url = url_for(
-                    "external.get_brief_by_id",
-                    framework_family=(brief.get("framework")).get("family"),
-                    brief_id=opportunity.get("briefId")
-                )
-                opportunity_row.append(
-                    {"html": f'<a class="govuk-link" href="{ opportunity_url }">Applications closed</a>'}
-                )
-                drafts.append(opportunity_row)
-        else:
+        if opportunity['status'] != 'draft':
+            completed.append(opportunity)
+        # Show applications for live briefs and briefs that closed up to 2 weeks ago
+        elif opportunity['brief']['status'] == 'live' or _applications_closed_at(opportunity) > two_weeks_ago:
+            drafts.append(opportunity)
+
+    return sorted(drafts, key=_applications_closed_at), sorted(completed, key=_applications_closed_at, reverse=True)
+
+
+def _applications_closed_at(opportunity):
+    return opportunity['brief'].get('applicationsClosedAt')
+
+
+def _paginate(opportunities, page_arg):
+    """Return the page of `opportunities` asked for by the `page_arg` query parameter, and links to the others"""
+    page_size = current_app.config['DM_OPPORTUNITIES_DASHBOARD_PAGE_SIZE']
+    page = request.args.get(page_arg, 1, type=int)
+    pages = max(ceil(len(opportunities) / page_size), 1)
+    if not 1 <= page <= pages:
+        abort(404)
+
+    def page_url(page):
+        args = dict(request.args.items(), **request.view_args)
+        args[page_arg] = page
+        return url_for('.opportunities_dashboard', **args)
+
+    return opportunities[(page - 1) * page_size:page * page_size], {
+        "page": page,
+        "pages": pages,
+        "previous_url": page_url(page - 1) if page > 1 else None,
+        "next_url": page_url(page + 1) if page < pages else None,
+    }
+
+
+def _draft_row(opportunity):
+    brief = opportunity.get('brief')
+    applicationsClosedAt = brief.get("applicationsClosedAt")
+
+    opportunity_row = [
+        {"text": brief.get('title')},
+        {"text": dateformat(applicationsClosedAt), "attributes": {"data-closed": applicationsClosedAt}},
+        {"text": "Draft"},
+    ]
+
+    if brief['status'] == 'live':
+        if opportunity.get("essentialRequirementsMet"):
             opportunity_url = url_for(
-                ".check_brief_response_answers",
+                '.check_brief_response_answers',
                 brief_id=opportunity.get("briefId"),
                 brief_response_id=opportunity.get("id")
             )
-            opportunity_row = [
-                {"html": f'<a class="govuk-link" href="{ opportunity_url }">{brief.get("title")}</a>'},
-                {"text": dateformat(applicationsClosedAt), "attributes": {"data-closed": applicationsClosedAt}}
-            ]
-
-            status = brief.get("status")
-            if status == "cancelled":
-                opportunity_row.append({"text": "Opportunity cancelled"})
-            elif status == "unsuccessful":
-                opportunity_row.append({"text": "Not won"})
-            elif status == "withdrawn":
-                opportunity_row.append({"text": "Opportunity withdrawn"})
-            elif status == "closed" or status == "live":
-                opportunity_row.append({"text": "Submitted"})
-            elif opportunity.get("status") == "awarded":
-                opportunity_row.append({"text": "Won"})
-            elif status == "awarded":
-                opportunity_row.append({"text": "Not won"})
-
-            completed.append(opportunity_row)
+        else:
+            opportunity_url = url_for('.start_brief_response', brief_id=opportunity.get("briefId"))
+        opportunity_row.append(
+            {"html": f'<a class="govuk-link" href="{opportunity_url}">Complete your application</a>'}
+        )
+    else:
+        opportunity_url = url_for(
+            "external.get_brief_by_id",
+            framework_family=(brief.get("framework")).get("family"),
+            brief_id=opportunity.get("briefId")
+        )
+        opportunity_row.append(
+            {"html": f'<a class="govuk-link" href="{ opportunity_url }">Applications closed</a>'}
+        )
 
-    return render_template(
-        "frameworks/opportunities_dashboard.html",
-        framework=framework,
-        completed=completed,
-        drafts=drafts,
-    ), 200
+    return opportunity_row
+
+
+def _completed_row(opportunity):
+    brief = opportunity.get('brief')
+    applicationsClosedAt = brief.get("applicationsClosedAt")
+
+    opportunity_url = url_for(
+        ".check_brief_response_answers",
+        brief_id=opportunity.get("briefId"),
+        brief_response_id=opportunity.get("id")
+    )
+    opportunity_row = [
+        {"html": f'<a class="govuk-link" href="{ opportunity_url }">{brief.get("title")}</a>'},
+        {"text": dateformat(applicationsClosedAt), "attributes": {"data-closed": applicationsClosedAt}}
+    ]
+
+    status = brief.get("status")
+    if status == "cancelled":
+        opportunity_row.append({"text": "Opportunity cancelled"})
+    elif status == "unsuccessful":
+        opportunity_row.append({"text": "Not won"})
+    elif status == "withdrawn":
+        opportunity_row.append({"text": "Opportunity withdrawn"})
+    elif status == "closed" or status == "live":
+        opportunity_row.append({"text": "Submitted"})
+    elif opportunity.get("status") == "awarded":
+        opportunity_row.append({"text": "Won"})
+    elif status == "awarded":
+        opportunity_row.append({"text": "Not won"})
+
+    return opportunity_row
@@ -2,10 +2,101 @@ from flask import Blueprint
 from flask.signals import got_request_exception, request_finished
 
 from gds_metrics import GDSMetrics
+from gds_metrics.metrics import Counter, Histogram
 
 
 metrics = Blueprint('metrics', __name__)
 
+CACHE_LOOKUPS_TOTAL = Counter(
+    'cache_lookups_total',
+    'Total number of in-process cache lookups',
+    ['cache', 'result']
+)
+
+CACHE_EVICTIONS_TOTAL = Counter(
+    'cache_evictions_total',
+    'Total number of entries evicted from in-process caches to make room for new ones',
+    ['cache']
+)
+
+SINGLE_FLIGHT_CALLS_TOTAL = Counter(
+    'single_flight_calls_total',
+    'Total number of calls made, and shared between concurrent callers, by single-flight call groups',
+    ['group', 'result']
+)
+
+CIRCUIT_BREAKER_EVENTS_TOTAL = Counter(
+    'circuit_breaker_events_total',
+    'Total number of times circuit breakers opened or closed, and calls they rejected while open',
+    ['breaker', 'event']
+)
+
+STALE_CACHE_RESPONSES_TOTAL = Counter(
+    'stale_cache_responses_total',
+    'Total number of stale cached values served, by whether they were being revalidated or the source was unavailable',
+    ['cache', 'reason']
+)
+
+DATA_API_CONNECTIONS_CREATED_TOTAL = Counter(
+    'data_api_connections_created_total',
+    'Total number of connections opened to the data API',
+)
+
+DATA_API_CONNECTION_POOL_EXHAUSTED_TOTAL = Counter(
+    'data_api_connection_pool_exhausted_total',
+    'Total number of times a data API request found every pooled connection in use',
+)
+
+DATA_API_CONNECTIONS_DISCARDED_TOTAL = Counter(
+    'data_api_connections_discarded_total',
+    'Total number of data API connections closed rather than kept alive because the pool was full',
+)
+
+DATA_API_HEDGED_REQUESTS_TOTAL = Counter(
+    'data_api_hedged_requests_total',
+    'Total number of slow data API GETs hedged with a second request, hedges answering for failed requests, hedges '
+    'over budget and GETs not hedged because every hedging thread was busy',
+    ['endpoint', 'result']
+)
+
+DATA_API_CONCURRENT_FETCHES_TOTAL = Counter(
+    'data_api_concurrent_fetches_total',
+    'Total number of data API fetches made alongside others, by whether a pool thread or the caller made them',
+    ['thread']
+)
+
+DATA_API_CONDITIONAL_GETS_TOTAL = Counter(
+    'data_api_conditional_gets_total',
+    'Total number of data API GETs for cacheable resources, by whether a kept response could be used',
+    ['result']
+)
+
+CONTENT_LOADER_COPIES_TOTAL = Counter(
+    'content_loader_copies_total',
+    'Total number of copies made of the primary content loader',
+)
+
+CONTENT_LOADER_COPY_DURATION_SECONDS = Histogram(
+    'content_loader_copy_duration_seconds',
+    'Time spent copying the primary content loader in seconds',
+)
+
+CONTENT_MANIFEST_RELOADS_TOTAL = Counter(
+    'content_manifest_reloads_total',
+    'Total number of content manifests reloaded after their files changed',
+    ['framework', 'manifest']
+)
+
+SUPPLIER_ELIGIBILITY_SAVED_SECONDS_TOTAL = Counter(
+    'supplier_eligibility_saved_seconds_total',
+    'Total time in seconds saved by answering supplier eligibility checks from the cache rather than the API',
+)
+
+BRIEF_RESPONSE_SAVES_SKIPPED_TOTAL = Counter(
+    'brief_response_saves_skipped_total',
+    'Total number of brief response question pages submitted without changes, so not saved to the API',
+)
+
 
 class DMGDSMetrics(GDSMetrics):
     """Custom metrics class to prevent metrics endpoint being bound to base application object.
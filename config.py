@@ -40,6 +40,75 @@ class Config(object):
 
     SECRET_KEY = None
 
+    # (framework slug, manifest) pairs to load at startup - anything else is loaded when it's first needed
+    DM_CONTENT_PRELOAD_MANIFESTS = []
+
+    # seconds between checks for changes to the content files of loaded manifests, or None to never reload them
+    DM_CONTENT_RELOAD_INTERVAL = None
+
+    # number of filtered content manifests (one per brief and question flow) to keep in memory
+    DM_FILTERED_MANIFEST_CACHE_SIZE = 256
+
+    # brief summaries shown after applying - kept for longer once a brief has closed, as it can't change again
+    DM_BRIEF_SUMMARY_CACHE_SIZE = 256
+    DM_BRIEF_SUMMARY_CACHE_TTL = 5 * 60
+    DM_CLOSED_BRIEF_SUMMARY_CACHE_TTL = 24 * 60 * 60
+
+    # connections to the data API kept alive between requests - the pool size should cover the number of threads
+    # making requests at once (including DM_DATA_API_FETCH_WORKERS)
+    DM_DATA_API_POOL_CONNECTIONS = 4
+    DM_DATA_API_POOL_MAXSIZE = 16
+    DM_DATA_API_POOL_BLOCK = False
+
+    # briefs and brief responses kept to revalidate with conditional GETs rather than downloading them again
+    DM_DATA_API_RESPONSE_CACHE_SIZE = 512
+
+    # opt-in hedging of data API GETs: regular expressions for the paths to hedge, the percentile of their recent
+    # response times after which the request is made again, the extra requests allowed as a fraction of requests to
+    # each, and the threads (shared by the whole process) making them
+    DM_DATA_API_HEDGED_PATHS = []
+    DM_DATA_API_HEDGE_PERCENTILE = 95
+    DM_DATA_API_HEDGE_BUDGET = 0.05
+    DM_DATA_API_HEDGE_WORKERS = 16
+
+    # threads (shared by the whole process) used to make independent data API calls for a page at the same time, as
+    # well as the thread handling the request - when they're all busy, requests make their own calls one at a time
+    DM_DATA_API_FETCH_WORKERS = 8
+
+    # frameworks from the API - they rarely change, but when they do (eg going live) it should show within the TTL
+    DM_FRAMEWORK_CACHE_SIZE = 32
+    DM_FRAMEWORK_CACHE_TTL = 5 * 60
+    # ...after which they're served while being refreshed in the background, or if the API is unavailable
+    DM_FRAMEWORK_CACHE_STALE_TTL = 60 * 60
+    DM_FRAMEWORK_CACHE_STALE_IF_ERROR_TTL = 24 * 60 * 60
+
+    # whether suppliers can apply for briefs - this hardly ever changes while they're filling in a response
+    DM_SUPPLIER_ELIGIBILITY_CACHE_SIZE = 1024
+    DM_SUPPLIER_ELIGIBILITY_CACHE_TTL = 60
+
+    # suppliers' published services by framework, used for their max day rates and why they can't apply for a brief
+    DM_SUPPLIER_SERVICES_CACHE_SIZE = 1024
+    DM_SUPPLIER_SERVICES_CACHE_TTL = 5 * 60
+
+    # seconds a fetched brief is shared with other requests for it, on top of sharing fetches already in flight
+    DM_BRIEF_FETCH_COALESCING_WINDOW = 1
+
+    # briefs last fetched, served for up to this many seconds if the API is unavailable
+    DM_BRIEF_CACHE_SIZE = 1024
+    DM_BRIEF_CACHE_STALE_IF_ERROR_TTL = 5 * 60
+
+    # consecutive data API timeouts/server errors after which cached lookups stop asking it, and seconds before they
+    # try again
+    DM_DATA_API_CIRCUIT_BREAKER_THRESHOLD = 5
+    DM_DATA_API_CIRCUIT_BREAKER_RESET_TIMEOUT = 30
+
+    # rows in each table of a supplier's opportunities dashboard
+    DM_OPPORTUNITIES_DASHBOARD_PAGE_SIZE = 50
+    # suppliers' brief responses for their dashboards, fetched again once they've changed one - the TTL bounds how long
+    # briefs changing status (or changes made by other users of the supplier) can go unseen
+    DM_OPPORTUNITIES_DASHBOARD_CACHE_SIZE = 1024
+    DM_OPPORTUNITIES_DASHBOARD_CACHE_TTL = 60
+
     STATIC_URL_PATH = '/suppliers/opportunities/static'
     ASSET_PATH = STATIC_URL_PATH + '/'
     BASE_TEMPLATE_DATA = {
@@ -87,6 +156,9 @@ class Test(Config):
 
     DM_DATA_API_AUTH_TOKEN = 'myToken'
 
+    # tests change briefs between requests
+    DM_BRIEF_FETCH_COALESCING_WINDOW = 0
+
 
 class Development(Config):
     DEBUG = True
@@ -100,6 +172,8 @@ class Development(Config):
     DM_NOTIFY_API_KEY = "not_a_real_key"
     SECRET_KEY = 'verySecretKey'
 
+    DM_CONTENT_RELOAD_INTERVAL = 2
+
 
 class Live(Config):
     """Base config for deployed environments"""
@@ -107,6 +181,12 @@ class Live(Config):
     DM_LOG_PATH = '/var/log/digitalmarketplace/application.log'
     DM_HTTP_PROTO = 'https'
 
+    DM_CONTENT_PRELOAD_MANIFESTS = [
+        ('digital-outcomes-and-specialists-5', 'edit_brief'),
+        ('digital-outcomes-and-specialists-5', 'edit_brief_response'),
+        ('digital-outcomes-and-specialists-5', 'display_brief_response'),
+    ]
+
     # use of invalid email addresses with live api keys annoys Notify
     DM_NOTIFY_REDIRECT_DOMAINS_TO_ADDRESS = {
         "example.com": "success@simulator.amazonses.com",
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""Compare looking up questions by scanning a content manifest with looking them up in its ContentIndex.
+
+The cost of a ContentIndex lookup should stay flat as the number of questions in the manifest grows.
+
+Usage: scripts/benchmark_content_index.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from dmcontent.content_loader import ContentManifest  # noqa: E402
+
+from app.main.helpers.content import ContentIndex  # noqa: E402
+
+
+QUESTION_COUNTS = [10, 100, 1000, 10000]
+LOOKUPS = 1000
+
+
+def make_content(question_count):
+    return ContentManifest([{
+        'slug': 'your-application',
+        'name': 'Your application',
+        'editable': True,
+        'questions': [
+            {'id': 'question{}'.format(i), 'type': 'text', 'question': 'Question {}'.format(i)}
+            for i in range(question_count)
+        ],
+    }])
+
+
+if __name__ == '__main__':
+    print("{:>10} {:>20} {:>20}".format("questions", "scan (us/lookup)", "index (us/lookup)"))
+    for question_count in QUESTION_COUNTS:
+        content = make_content(question_count)
+        index = ContentIndex(content)
+        section = index.next_editable_section
+        # the last question is the worst case for a scan
+        question_id = 'question{}'.format(question_count - 1)
+
+        scan = timeit.timeit(lambda: section.get_question(question_id), number=LOOKUPS)
+        indexed = timeit.timeit(lambda: index.get_question(question_id, section), number=LOOKUPS)
+
+        print("{:>10} {:>20.2f} {:>20.2f}".format(
+            question_count, scan / LOOKUPS * 1e6, indexed / LOOKUPS * 1e6
+        ))
@@ -4,6 +4,9 @@ set -e
 
 npm run frontend-build:production 1>&2
 
+# Precompile the content manifests so app processes don't have to parse the YAML when they start
+python scripts/build_content_bundle.py 1>&2
+
 # Non-Git paths that should be included when deploying
 echo "app/static"
 echo "app/templates/toolkit"
@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+"""Build the precompiled content bundle the app loads its content manifests from at startup.
+
+The bundle has to be rebuilt whenever the content in app/content changes - the app ignores a stale bundle and falls
+back to loading the YAML files.
+
+Usage: scripts/build_content_bundle.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.main import CONTENT_BUNDLE_PATH, CONTENT_MANIFESTS, CONTENT_PATH  # noqa: E402
+from app.main.helpers.content import write_content_bundle  # noqa: E402
+
+
+if __name__ == '__main__':
+    write_content_bundle(CONTENT_BUNDLE_PATH, CONTENT_PATH, CONTENT_MANIFESTS)
+    print("Wrote content bundle to {}".format(CONTENT_BUNDLE_PATH), file=sys.stderr)
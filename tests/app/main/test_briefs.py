@@ -10,6 +10,7 @@ from dmapiclient.audit import AuditTypes
 from dmtestutils.api_model_stubs import BriefStub, FrameworkStub, LotStub
 from dmutils.email.exceptions import EmailError
 
+from app.main.helpers.briefs import get_supplier_services
 from app.main.views.briefs import _render_not_eligible_for_brief_error_page, PUBLISHED_BRIEF_STATUSES
 
 from ..helpers import BaseApplicationTest
@@ -411,9 +412,7 @@ class TestSubmitClarificationQuestions(BaseApplicationTest):
         ).single_result_response()
         self.data_api_client.get_brief.return_value['briefs']['frameworkName'] = 'Digital Outcomes and Specialists'
         self.data_api_client.is_supplier_eligible_for_brief.return_value = False
-        self.data_api_client.find_services.side_effect = lambda *args, **kwargs: (
-            {"services": [{"something": "nonempty"}]} if kwargs.get("lot") is None else {"services": []}
-        )
+        self.data_api_client.find_services.return_value = {"services": [{"lotSlug": "digital-outcomes"}]}
 
         res = self.client.post('/suppliers/opportunities/1/ask-a-question', data={
             'clarification_question': "important question",
@@ -460,7 +459,7 @@ class TestSubmitClarificationQuestions(BaseApplicationTest):
         ).single_result_response()
         self.data_api_client.get_brief.return_value['briefs']['frameworkName'] = 'Digital Outcomes and Specialists'
         self.data_api_client.is_supplier_eligible_for_brief.return_value = False
-        self.data_api_client.find_services.return_value = {"services": [{"something": "nonempty"}]}
+        self.data_api_client.find_services.return_value = {"services": [{"lotSlug": "digital-specialists"}]}
 
         res = self.client.post('/suppliers/opportunities/1/ask-a-question', data={
             'clarification_question': "important question",
@@ -569,7 +568,7 @@ class TestApplyToBrief(BaseApplicationTest):
         content_loader.get_manifest.return_value \
             .filter.return_value \
             .get_section.return_value \
-            .get_next_question_id.return_value = 'first'
+            .questions = [mock.Mock(id='first'), mock.Mock(id='second')]
 
         res = self.client.get('/suppliers/opportunities/1234/responses/5')
         assert res.status_code == 302
@@ -795,7 +794,9 @@ class TestApplyToBrief(BaseApplicationTest):
     def test_day_rate_question_replays_buyers_budget_range_and_suppliers_max_day_rate(self):
         self.brief['briefs']['budgetRange'] = '1 million dollars'
         self.brief['briefs']['specialistRole'] = 'deliveryManager'
-        self.data_api_client.find_services.return_value = {"services": [{"deliveryManagerPriceMax": 600}]}
+        self.data_api_client.find_services.return_value = {
+            "services": [{"lotSlug": "digital-specialists", "deliveryManagerPriceMax": 600}]
+        }
 
         res = self.client.get(
             '/suppliers/opportunities/1234/responses/5/dayRate'
@@ -835,7 +836,9 @@ class TestApplyToBrief(BaseApplicationTest):
 
     def test_day_rate_question_does_not_replay_buyers_budget_range_if_not_provided(self):
         self.brief['briefs']['specialistRole'] = 'deliveryManager'
-        self.data_api_client.find_services.return_value = {"services": [{"deliveryManagerPriceMax": 600}]}
+        self.data_api_client.find_services.return_value = {
+            "services": [{"lotSlug": "digital-specialists", "deliveryManagerPriceMax": 600}]
+        }
 
         res = self.client.get(
             '/suppliers/opportunities/1234/responses/5/dayRate'
@@ -1312,7 +1315,22 @@ class TestApplyToBrief(BaseApplicationTest):
 
         assert res.location == 'http://localhost.localdomain/suppliers/opportunities/1234/responses/5/essentialRequirementsMet'  # noqa
 
-    def test_post_final_section_submits_response_redirects_to_check_your_answers_page(self):
+    def test_post_form_with_unchanged_answers_skips_update_and_redirects_to_next_section(self):
+        self.data_api_client.get_brief_response.return_value = self.brief_response(data={'dayRate': '500'})
+
+        res = self.client.post(
+            '/suppliers/opportunities/1234/responses/5/dayRate',
+            data={'dayRate': '500'}
+        )
+
+        assert res.status_code == 302
+        assert self.data_api_client.update_brief_response.called is False
+        assert res.location == 'http://localhost.localdomain/suppliers/opportunities/1234/responses/5/essentialRequirementsMet'  # noqa
+
+    @mock.patch('app.main.views.briefs.invalidate_opportunities_dashboard')
+    def test_post_final_section_submits_response_redirects_to_check_your_answers_page(
+        self, invalidate_opportunities_dashboard
+    ):
         data = {'respondToEmailAddress': 'bob@example.com'}
         res = self.client.post(
             '/suppliers/opportunities/1234/responses/5/respondToEmailAddress',
@@ -1326,11 +1344,39 @@ class TestApplyToBrief(BaseApplicationTest):
             'email@email.com',
             page_questions=['respondToEmailAddress']
         )
+        invalidate_opportunities_dashboard.assert_called_once_with(1234, 'digital-outcomes-and-specialists-4')
 
         assert res.location == 'http://localhost.localdomain/suppliers/opportunities/1234/responses/5/application'
         self.assert_no_flashes()
 
-    def test_post_check_your_answers_page_submits_and_redirects_to_result_page(self):
+    def test_brief_response_changed_by_another_request_is_fetched_again(self):
+        self.client.post(
+            '/suppliers/opportunities/1234/responses/5/respondToEmailAddress',
+            data={'respondToEmailAddress': 'bob@example.com'},
+        )
+        # changed through another instance of the app between requests
+        self.data_api_client.get_brief_response.return_value = self.brief_response(
+            data={'respondToEmailAddress': 'alice@example.com'}
+        )
+        self.data_api_client.update_brief_response.reset_mock()
+
+        res = self.client.post(
+            '/suppliers/opportunities/1234/responses/5/respondToEmailAddress',
+            data={'respondToEmailAddress': 'bob@example.com'},
+        )
+
+        assert res.status_code == 302
+        self.data_api_client.update_brief_response.assert_called_once_with(
+            5,
+            {'respondToEmailAddress': 'bob@example.com'},
+            'email@email.com',
+            page_questions=['respondToEmailAddress']
+        )
+
+    @mock.patch('app.main.views.briefs.invalidate_opportunities_dashboard')
+    def test_post_check_your_answers_page_submits_and_redirects_to_result_page(
+        self, invalidate_opportunities_dashboard
+    ):
         res = self.client.post(
             '/suppliers/opportunities/1234/responses/5/application',
             data={}
@@ -1341,6 +1387,7 @@ class TestApplyToBrief(BaseApplicationTest):
             5,
             'email@email.com',
         )
+        invalidate_opportunities_dashboard.assert_called_once_with(1234, 'digital-outcomes-and-specialists-4')
         assert res.location == 'http://localhost.localdomain/suppliers/opportunities/1234/responses/result'
         self.assert_flashes("Your application has been submitted.", "success")
 
@@ -1968,7 +2015,10 @@ class TestPostStartBriefResponseApplication(BaseApplicationTest):
         assert res.status_code == 403
         _render_not_eligible_for_brief_error_page.assert_called_once_with(self.brief['briefs'])
 
-    def test_valid_post_calls_api_and_redirects_to_edit_the_created_brief_response_if_no_application_started(self):
+    @mock.patch('app.main.views.briefs.invalidate_opportunities_dashboard')
+    def test_valid_post_calls_api_and_redirects_to_edit_the_created_brief_response_if_no_application_started(
+        self, invalidate_opportunities_dashboard
+    ):
         self.data_api_client.get_brief.return_value = self.brief
         self.data_api_client.find_brief_responses.return_value = {
             'briefResponses': []
@@ -1981,6 +2031,7 @@ class TestPostStartBriefResponseApplication(BaseApplicationTest):
 
         res = self.client.post('/suppliers/opportunities/1234/responses/start')
         self.data_api_client.create_brief_response.assert_called_once_with(1234, 1234, {}, "email@email.com")
+        invalidate_opportunities_dashboard.assert_called_once_with(1234, self.brief['briefs']['frameworkSlug'])
         assert res.status_code == 302
         assert res.location == 'http://localhost.localdomain/suppliers/opportunities/1234/responses/10'
 
@@ -2402,27 +2453,14 @@ class TestRenderNotEligibleForBriefErrorPage(BaseApplicationTest):
 
     def test_not_on_lot(self, render_template, current_user):
         current_user.supplier_id = 100
-        self.data_api_client.find_services.side_effect = lambda *args, **kwargs: (
-            {"services": [{"something": "nonempty"}]} if kwargs.get("lot") is None else {"services": []}
-        )
+        self.data_api_client.find_services.return_value = {"services": [{"lotSlug": "digital-outcomes"}]}
 
         _render_not_eligible_for_brief_error_page(self.brief)
 
-        self.data_api_client.find_services.assert_has_calls(
-            [
-                mock.call(
-                    supplier_id=100,
-                    framework='digital-outcomes-and-specialists',
-                    status='published'
-                ),
-                mock.call(
-                    supplier_id=100,
-                    framework='digital-outcomes-and-specialists',
-                    status='published',
-                    lot='digital-specialists'
-                ),
-            ],
-            any_order=True
+        self.data_api_client.find_services.assert_called_once_with(
+            supplier_id=100,
+            framework='digital-outcomes-and-specialists',
+            status='published'
         )
         render_template.assert_called_with(
             "briefs/not_is_supplier_eligible_for_brief_error.html",
@@ -2435,25 +2473,14 @@ class TestRenderNotEligibleForBriefErrorPage(BaseApplicationTest):
 
     def test_not_on_role(self, render_template, current_user):
         current_user.supplier_id = 100
-        self.data_api_client.find_services.return_value = {"services": [{"service": "data"}]}
+        self.data_api_client.find_services.return_value = {"services": [{"lotSlug": "digital-specialists"}]}
 
         _render_not_eligible_for_brief_error_page(self.brief)
 
-        self.data_api_client.find_services.assert_has_calls(
-            [
-                mock.call(
-                    supplier_id=100,
-                    framework='digital-outcomes-and-specialists',
-                    status='published'
-                ),
-                mock.call(
-                    supplier_id=100,
-                    framework='digital-outcomes-and-specialists',
-                    status='published',
-                    lot='digital-specialists'
-                ),
-            ],
-            any_order=True
+        self.data_api_client.find_services.assert_called_once_with(
+            supplier_id=100,
+            framework='digital-outcomes-and-specialists',
+            status='published'
         )
         render_template.assert_called_with(
             "briefs/not_is_supplier_eligible_for_brief_error.html",
@@ -2464,6 +2491,16 @@ class TestRenderNotEligibleForBriefErrorPage(BaseApplicationTest):
             data_reason_slug='supplier-not-on-role',
         )
 
+    def test_reuses_services_already_fetched_for_the_supplier(self, render_template, current_user):
+        current_user.supplier_id = 100
+        self.data_api_client.find_services.return_value = {"services": [{"lotSlug": "digital-outcomes"}]}
+
+        get_supplier_services(self.data_api_client, 100, 'digital-outcomes-and-specialists')
+        _render_not_eligible_for_brief_error_page(self.brief)
+
+        assert self.data_api_client.find_services.call_count == 1
+        assert render_template.call_args[1]['reason'] == 'supplier-not-on-lot'
+
 
 class TestRedirectToPublicOpportunityPage(BaseApplicationTest):
 
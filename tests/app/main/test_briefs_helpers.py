@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+from threading import Barrier, Thread
+from time import sleep
+
+import mock
+import pytest
+from dmapiclient import HTTPError
+from flask import Flask
+
+from app.data_api import DataAPICircuitOpenError, RequestMemoizingDataAPIClient, data_api_circuit_breaker
+from app.main.helpers.briefs import (
+    SupplierServices,
+    brief_cache,
+    brief_fetches,
+    get_brief,
+    get_supplier_services,
+    invalidate_supplier_eligibility,
+    is_supplier_eligible_for_brief,
+    save_brief_response_changes,
+    supplier_eligibility_cache,
+    supplier_services_cache,
+)
+
+
+class TestGetBrief(object):
+
+    def setup_method(self, method):
+        brief_fetches.configure(window=0)
+        brief_cache.configure(maxsize=32, stale_if_error_ttl=300)
+        data_api_circuit_breaker.configure(failure_threshold=2, reset_timeout=30)
+        self.data_api_client = mock.Mock()
+        self.data_api_client.get_brief.return_value = {'briefs': {'id': 1234, 'status': 'live'}}
+
+    def test_returns_a_copy_of_the_brief_for_each_caller(self):
+        brief_fetches.configure(window=60)
+
+        first = get_brief(self.data_api_client, 1234)
+        first['status'] = 'changed'
+
+        assert get_brief(self.data_api_client, 1234) == {'id': 1234, 'status': 'live'}
+        assert self.data_api_client.get_brief.call_count == 1
+
+    def test_briefs_are_fetched_every_time(self):
+        get_brief(self.data_api_client, 1234)
+        get_brief(self.data_api_client, 1234)
+
+        assert self.data_api_client.get_brief.call_count == 2
+
+    def test_last_fetched_brief_is_returned_if_the_api_is_unavailable(self):
+        get_brief(self.data_api_client, 1234)
+        self.data_api_client.get_brief.side_effect = HTTPError(mock.Mock(status_code=503))
+
+        assert get_brief(self.data_api_client, 1234) == {'id': 1234, 'status': 'live'}
+
+    def test_api_errors_are_raised_with_no_brief_to_fall_back_on(self):
+        self.data_api_client.get_brief.side_effect = HTTPError(mock.Mock(status_code=503))
+
+        with pytest.raises(HTTPError):
+            get_brief(self.data_api_client, 1234)
+
+    def test_api_is_not_asked_while_circuit_is_open(self):
+        get_brief(self.data_api_client, 1234)
+        self.data_api_client.get_brief.side_effect = HTTPError(mock.Mock(status_code=503))
+        for _ in range(2):
+            get_brief(self.data_api_client, 1234)
+
+        assert get_brief(self.data_api_client, 1234) == {'id': 1234, 'status': 'live'}
+        with pytest.raises(DataAPICircuitOpenError):
+            get_brief(self.data_api_client, 5678)
+        assert self.data_api_client.get_brief.call_count == 3
+
+    def test_stress_concurrent_fetches_of_the_same_brief_share_one_api_call(self):
+        def slow_get_brief(brief_id):
+            sleep(0.2)
+            return {'briefs': {'id': brief_id, 'status': 'live'}}
+
+        self.data_api_client.get_brief.side_effect = slow_get_brief
+        start = Barrier(100, timeout=5)
+        briefs = []
+
+        def fetch_brief():
+            start.wait()
+            briefs.append(get_brief(self.data_api_client, 1234, allowed_statuses=['live']))
+
+        threads = [Thread(target=fetch_brief) for _ in range(100)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        assert briefs == [{'id': 1234, 'status': 'live'}] * 100
+        # every thread starts while the first fetch is still in flight
+        assert self.data_api_client.get_brief.call_count == 1
+
+
+class TestSaveBriefResponseChanges(object):
+
+    def setup_method(self, method):
+        self.brief_response = {
+            'id': 5, 'briefId': 1234, 'supplierId': 5678, 'dayRate': '500', 'respondToEmailAddress': 'a@example.com',
+        }
+        self.data_api_client = mock.Mock()
+        self.data_api_client.get_brief_response.side_effect = lambda brief_response_id: {
+            'briefResponses': dict(self.brief_response)
+        }
+        self.app = Flask(__name__)
+
+    def test_only_changed_answers_are_sent(self):
+        save_brief_response_changes(
+            self.data_api_client, 5, ['dayRate', 'respondToEmailAddress'],
+            {'dayRate': '600', 'respondToEmailAddress': 'a@example.com'}, 'user@example.com',
+            page_questions=['dayRate', 'respondToEmailAddress'],
+        )
+
+        self.data_api_client.update_brief_response.assert_called_once_with(
+            5, {'dayRate': '600'}, 'user@example.com', page_questions=['dayRate', 'respondToEmailAddress']
+        )
+
+    def test_new_answers_are_sent_even_if_empty(self):
+        save_brief_response_changes(
+            self.data_api_client, 5, ['availability'], {'availability': None}, 'user',
+        )
+
+        self.data_api_client.update_brief_response.assert_called_once_with(5, {'availability': None}, 'user')
+
+    def test_unanswered_questions_are_still_sent_to_the_api_to_validate(self):
+        save_brief_response_changes(
+            self.data_api_client, 5, ['availability'], {}, 'user',
+            page_questions=['availability'],
+        )
+
+        self.data_api_client.update_brief_response.assert_called_once_with(
+            5, {}, 'user', page_questions=['availability']
+        )
+
+    @mock.patch('app.main.helpers.briefs.BRIEF_RESPONSE_SAVES_SKIPPED_TOTAL')
+    def test_unchanged_answers_are_not_saved(self, saves_skipped_total):
+        assert save_brief_response_changes(
+            self.data_api_client, 5, ['dayRate'], {'dayRate': '500'}, 'user',
+            page_questions=['dayRate'],
+        ) is None
+
+        assert self.data_api_client.update_brief_response.called is False
+        saves_skipped_total.inc.assert_called_once_with()
+
+    def test_answers_are_compared_with_the_brief_response_fetched_in_this_request(self):
+        data_api_client = RequestMemoizingDataAPIClient(self.data_api_client)
+        with self.app.app_context():
+            brief_response = data_api_client.get_brief_response(5)['briefResponses']
+            save_brief_response_changes(data_api_client, 5, ['dayRate'], {'dayRate': '600'}, 'user')
+
+        assert brief_response['dayRate'] == '500'
+        self.data_api_client.get_brief_response.assert_called_once_with(5)
+        self.data_api_client.update_brief_response.assert_called_once_with(5, {'dayRate': '600'}, 'user')
+
+    def test_answers_changed_back_since_an_earlier_request_are_saved(self):
+        data_api_client = RequestMemoizingDataAPIClient(self.data_api_client)
+        with self.app.app_context():
+            data_api_client.get_brief_response(5)
+        # changed through another instance of the app, then changed back to the earlier answer
+        self.brief_response['dayRate'] = '600'
+
+        with self.app.app_context():
+            save_brief_response_changes(data_api_client, 5, ['dayRate'], {'dayRate': '500'}, 'user')
+
+        self.data_api_client.update_brief_response.assert_called_once_with(5, {'dayRate': '500'}, 'user')
+
+
+class TestIsSupplierEligibleForBrief(object):
+
+    def setup_method(self, method):
+        supplier_eligibility_cache.configure(maxsize=32, ttl=60)
+        self.data_api_client = mock.Mock()
+        self.data_api_client.is_supplier_eligible_for_brief.return_value = True
+        self.brief = {'id': 1234}
+
+    def test_asks_the_api(self):
+        assert is_supplier_eligible_for_brief(self.data_api_client, 5678, self.brief) is True
+        self.data_api_client.is_supplier_eligible_for_brief.assert_called_once_with(5678, 1234)
+
+    def test_answers_are_cached_per_supplier_and_brief(self):
+        is_supplier_eligible_for_brief(self.data_api_client, 5678, self.brief)
+        is_supplier_eligible_for_brief(self.data_api_client, 5678, self.brief)
+        is_supplier_eligible_for_brief(self.data_api_client, 5678, {'id': 4321})
+        is_supplier_eligible_for_brief(self.data_api_client, 8765, self.brief)
+
+        assert self.data_api_client.is_supplier_eligible_for_brief.call_args_list == [
+            mock.call(5678, 1234), mock.call(5678, 4321), mock.call(8765, 1234)
+        ]
+
+    def test_ineligible_answers_are_cached_too(self):
+        self.data_api_client.is_supplier_eligible_for_brief.return_value = False
+
+        assert is_supplier_eligible_for_brief(self.data_api_client, 5678, self.brief) is False
+        assert is_supplier_eligible_for_brief(self.data_api_client, 5678, self.brief) is False
+        assert self.data_api_client.is_supplier_eligible_for_brief.call_count == 1
+
+    def test_answers_expire_after_ttl(self):
+        with mock.patch('app.cache.monotonic', return_value=1000):
+            is_supplier_eligible_for_brief(self.data_api_client, 5678, self.brief)
+        with mock.patch('app.cache.monotonic', return_value=1060):
+            is_supplier_eligible_for_brief(self.data_api_client, 5678, self.brief)
+
+        assert self.data_api_client.is_supplier_eligible_for_brief.call_count == 2
+
+    def test_invalidate_supplier_eligibility(self):
+        is_supplier_eligible_for_brief(self.data_api_client, 5678, self.brief)
+
+        invalidate_supplier_eligibility(5678, 1234)
+        is_supplier_eligible_for_brief(self.data_api_client, 5678, self.brief)
+
+        assert self.data_api_client.is_supplier_eligible_for_brief.call_count == 2
+
+    def test_cache_hits_count_the_time_saved(self):
+        with mock.patch('app.main.helpers.briefs.perf_counter', side_effect=[10, 10.25]):
+            is_supplier_eligible_for_brief(self.data_api_client, 5678, self.brief)
+
+        with mock.patch('app.main.helpers.briefs.SUPPLIER_ELIGIBILITY_SAVED_SECONDS_TOTAL') as saved_seconds:
+            is_supplier_eligible_for_brief(self.data_api_client, 5678, self.brief)
+
+        saved_seconds.inc.assert_called_once_with(0.25)
+
+
+class TestSupplierServices(object):
+
+    def setup_method(self, method):
+        self.supplier_services = SupplierServices([
+            {'lotSlug': 'digital-outcomes'},
+            {'lotSlug': 'digital-specialists', 'developerPriceMax': '700', 'designerPriceMax': '650'},
+        ])
+
+    def test_is_falsey_with_no_services(self):
+        assert not SupplierServices([])
+        assert self.supplier_services
+
+    def test_has_lot(self):
+        assert self.supplier_services.has_lot('digital-outcomes')
+        assert self.supplier_services.has_lot('digital-specialists')
+        assert not self.supplier_services.has_lot('user-research-studios')
+
+    def test_max_day_rate(self):
+        assert self.supplier_services.max_day_rate('digital-specialists', 'developer') == '700'
+        assert self.supplier_services.max_day_rate('digital-specialists', 'designer') == '650'
+        assert self.supplier_services.max_day_rate('digital-specialists', 'deliveryManager') is None
+        assert self.supplier_services.max_day_rate('digital-outcomes', 'developer') is None
+
+
+class TestGetSupplierServices(object):
+
+    def setup_method(self, method):
+        supplier_services_cache.configure(maxsize=32, ttl=300)
+        self.data_api_client = mock.Mock()
+        self.data_api_client.find_services.return_value = {
+            'services': [{'lotSlug': 'digital-specialists', 'developerPriceMax': '700'}]
+        }
+
+    def test_fetches_published_services_on_every_lot_of_the_framework(self):
+        supplier_services = get_supplier_services(self.data_api_client, 5678, 'digital-outcomes-and-specialists-4')
+
+        assert supplier_services.max_day_rate('digital-specialists', 'developer') == '700'
+        self.data_api_client.find_services.assert_called_once_with(
+            supplier_id=5678, framework='digital-outcomes-and-specialists-4', status='published',
+        )
+
+    def test_services_are_cached_per_supplier_and_framework(self):
+        get_supplier_services(self.data_api_client, 5678, 'digital-outcomes-and-specialists-4')
+        get_supplier_services(self.data_api_client, 5678, 'digital-outcomes-and-specialists-4')
+        get_supplier_services(self.data_api_client, 5678, 'digital-outcomes-and-specialists-5')
+        get_supplier_services(self.data_api_client, 9999, 'digital-outcomes-and-specialists-4')
+
+        assert self.data_api_client.find_services.call_count == 3
+
+    def test_services_expire_after_ttl(self):
+        with mock.patch('app.cache.monotonic', return_value=1000):
+            get_supplier_services(self.data_api_client, 5678, 'digital-outcomes-and-specialists-4')
+        with mock.patch('app.cache.monotonic', return_value=1300):
+            get_supplier_services(self.data_api_client, 5678, 'digital-outcomes-and-specialists-4')
+
+        assert self.data_api_client.find_services.call_count == 2
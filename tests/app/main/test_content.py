@@ -0,0 +1,510 @@
+# -*- coding: utf-8 -*-
+import os
+
+import mock
+import pytest
+
+from dmcontent.content_loader import ContentLoader, ContentManifest
+from dmcontent.errors import ContentNotFoundError
+
+from app.main.helpers.content import (
+    BundledContentLoader,
+    SharedContentLoader,
+    ContentIndex,
+    QuestionNavigation,
+    brief_summary_cache,
+    filtered_manifest_cache,
+    get_brief_response_display_manifest,
+    get_brief_summary,
+    get_content_index,
+    get_filtered_brief_manifest,
+    get_question_navigation,
+    inject_brief_questions,
+    read_content_bundle,
+    write_content_bundle,
+)
+
+from ..helpers import BaseApplicationTest
+
+
+@pytest.fixture
+def content_path(tmp_path):
+    framework_path = tmp_path / "frameworks" / "digital-outcomes-and-specialists"
+    (framework_path / "manifests").mkdir(parents=True)
+    (framework_path / "questions" / "brief-responses").mkdir(parents=True)
+
+    (framework_path / "manifests" / "display_brief_response.yml").write_text(
+        "- name: Your application\n"
+        "  editable: true\n"
+        "  questions:\n"
+        "    - dayRate\n"
+        "    - essentialRequirements\n"
+    )
+    (framework_path / "questions" / "brief-responses" / "dayRate.yml").write_text(
+        "question: Day rate\n"
+        "type: text\n"
+    )
+    (framework_path / "questions" / "brief-responses" / "essentialRequirements.yml").write_text(
+        "question: Essential skills and experience\n"
+        "type: boolean_list\n"
+    )
+
+    return str(tmp_path)
+
+
+CONTENT_MANIFESTS = {
+    'digital-outcomes-and-specialists': {
+        'display_brief_response': 'brief-responses',
+    },
+}
+
+
+def _loaded_content_loader(content_path):
+    content_loader = ContentLoader(content_path)
+    content_loader.load_manifest('digital-outcomes-and-specialists', 'brief-responses', 'display_brief_response')
+    return content_loader
+
+
+def _change_day_rate_question(content_path, question):
+    with open(os.path.join(
+        content_path, 'frameworks', 'digital-outcomes-and-specialists', 'questions', 'brief-responses', 'dayRate.yml'
+    ), 'w') as f:
+        f.write("question: {}\ntype: text\n".format(question))
+
+
+class TestSharedContentLoader(object):
+
+    def test_get_manifest_returns_independent_manifests(self, content_path):
+        content_loader = SharedContentLoader(_loaded_content_loader(content_path))
+
+        first = content_loader.get_manifest('digital-outcomes-and-specialists', 'display_brief_response')
+        second = content_loader.get_manifest('digital-outcomes-and-specialists', 'display_brief_response')
+
+        first.sections[0].questions.pop()
+
+        assert first is not second
+        assert len(second.sections[0].questions) == 2
+
+    def test_is_not_affected_by_changes_to_the_original_loader(self, content_path):
+        original = _loaded_content_loader(content_path)
+        content_loader = SharedContentLoader(original)
+
+        original.get_manifest('digital-outcomes-and-specialists', 'display_brief_response')
+        original._content['digital-outcomes-and-specialists']['display_brief_response'].pop()
+
+        manifest = content_loader.get_manifest('digital-outcomes-and-specialists', 'display_brief_response')
+        assert len(manifest.sections) == 1
+
+    def test_lazy_manifests_are_only_loaded_when_first_used(self, content_path):
+        lazy_content_loader = ContentLoader(content_path)
+        lazy_content_loader.lazy_load_manifests('digital-outcomes-and-specialists', {
+            'display_brief_response': 'brief-responses',
+            'not_a_real_manifest': 'brief-responses',
+        })
+
+        content_loader = SharedContentLoader(lazy_content_loader)
+
+        manifest = content_loader.get_manifest('digital-outcomes-and-specialists', 'display_brief_response')
+        assert manifest.get_question('dayRate')
+
+        with pytest.raises(ContentNotFoundError):
+            content_loader.get_manifest('digital-outcomes-and-specialists', 'not_a_real_manifest')
+
+    def test_load_manifests_loads_listed_manifests_up_front(self, content_path):
+        lazy_content_loader = ContentLoader(content_path)
+        lazy_content_loader.lazy_load_manifests('digital-outcomes-and-specialists', {
+            'display_brief_response': 'brief-responses',
+        })
+        content_loader = SharedContentLoader(lazy_content_loader)
+
+        content_loader.load_manifests([('digital-outcomes-and-specialists', 'display_brief_response')])
+        os.remove(os.path.join(
+            content_path, 'frameworks', 'digital-outcomes-and-specialists', 'manifests', 'display_brief_response.yml'
+        ))
+
+        manifest = content_loader.get_manifest('digital-outcomes-and-specialists', 'display_brief_response')
+        assert manifest.get_question('dayRate')
+
+    def test_reload_changed_manifests_swaps_in_changed_manifests(self, content_path):
+        content_loader = SharedContentLoader(_loaded_content_loader(content_path))
+        content_loader.watch_for_changes(CONTENT_MANIFESTS, interval=60)
+        old_manifest = content_loader.get_manifest('digital-outcomes-and-specialists', 'display_brief_response')
+
+        _change_day_rate_question(content_path, "Daily rate")
+        content_loader.reload_changed_manifests()
+
+        manifest = content_loader.get_manifest('digital-outcomes-and-specialists', 'display_brief_response')
+        assert manifest.get_question('dayRate').question == 'Daily rate'
+        assert old_manifest.get_question('dayRate').question == 'Day rate'
+        assert content_loader.get_manifest_version('digital-outcomes-and-specialists', 'display_brief_response') == 1
+
+    def test_reload_changed_manifests_leaves_unchanged_manifests_alone(self, content_path):
+        content_loader = SharedContentLoader(_loaded_content_loader(content_path))
+        content_loader.watch_for_changes(CONTENT_MANIFESTS, interval=60)
+
+        content_loader.reload_changed_manifests()
+
+        assert content_loader.get_manifest_version('digital-outcomes-and-specialists', 'display_brief_response') == 0
+
+    def test_reload_keeps_old_manifest_if_new_files_cant_be_loaded(self, content_path):
+        content_loader = SharedContentLoader(_loaded_content_loader(content_path))
+        content_loader.watch_for_changes(CONTENT_MANIFESTS, interval=60)
+
+        with open(os.path.join(
+            content_path, 'frameworks', 'digital-outcomes-and-specialists', 'manifests', 'display_brief_response.yml'
+        ), 'a') as f:
+            f.write("    - notARealQuestion\n")
+        content_loader.reload_changed_manifests()
+
+        manifest = content_loader.get_manifest('digital-outcomes-and-specialists', 'display_brief_response')
+        assert manifest.get_question('dayRate').question == 'Day rate'
+        assert content_loader.get_manifest_version('digital-outcomes-and-specialists', 'display_brief_response') == 0
+
+    def test_get_manifest_only_checks_for_changes_once_interval_has_passed(self, content_path):
+        content_loader = SharedContentLoader(_loaded_content_loader(content_path))
+        with mock.patch('app.main.helpers.content.monotonic', return_value=1000):
+            content_loader.watch_for_changes(CONTENT_MANIFESTS, interval=60)
+            content_loader.get_manifest('digital-outcomes-and-specialists', 'display_brief_response')
+        _change_day_rate_question(content_path, "Daily rate")
+
+        with mock.patch('app.main.helpers.content.monotonic', return_value=1059):
+            manifest = content_loader.get_manifest('digital-outcomes-and-specialists', 'display_brief_response')
+        assert manifest.get_question('dayRate').question == 'Day rate'
+
+        with mock.patch('app.main.helpers.content.monotonic', return_value=1060):
+            manifest = content_loader.get_manifest('digital-outcomes-and-specialists', 'display_brief_response')
+        assert manifest.get_question('dayRate').question == 'Daily rate'
+
+
+class TestGetFilteredBriefManifest(object):
+
+    def setup_method(self, method):
+        filtered_manifest_cache.clear()
+        self.brief = {
+            'id': 1234,
+            'frameworkSlug': 'digital-outcomes-and-specialists-4',
+            'updatedAt': '2016-03-29T10:11:13.000000Z',
+            'essentialRequirements': ['Essential one'],
+        }
+
+    def test_filters_manifest_for_brief(self):
+        content_loader = mock.Mock()
+
+        content = get_filtered_brief_manifest(
+            content_loader, 'edit_brief_response', self.brief, 'digital-specialists', max_day_rate='£200'
+        )
+
+        assert content == content_loader.get_manifest.return_value.filter.return_value
+        content_loader.get_manifest.assert_called_once_with('digital-outcomes-and-specialists-4', 'edit_brief_response')
+        content_loader.get_manifest.return_value.filter.assert_called_once_with(
+            {'lot': 'digital-specialists', 'brief': self.brief, 'max_day_rate': '£200'}
+        )
+
+    def test_filtered_manifest_is_cached_for_unchanged_brief(self):
+        content_loader = mock.Mock()
+
+        first = get_filtered_brief_manifest(content_loader, 'edit_brief_response', self.brief, 'digital-specialists')
+        second = get_filtered_brief_manifest(
+            content_loader, 'edit_brief_response', dict(self.brief), 'digital-specialists'
+        )
+
+        assert first is second
+        assert content_loader.get_manifest.call_count == 1
+
+    def test_filtered_manifest_is_not_reused_once_manifest_is_reloaded(self):
+        content_loader = mock.Mock()
+
+        content_loader.get_manifest_version.return_value = 0
+        get_filtered_brief_manifest(content_loader, 'edit_brief_response', self.brief, 'digital-specialists')
+        content_loader.get_manifest_version.return_value = 1
+        get_filtered_brief_manifest(content_loader, 'edit_brief_response', self.brief, 'digital-specialists')
+
+        assert content_loader.get_manifest.call_count == 2
+
+    def test_filtered_manifest_picks_up_changed_content(self, content_path):
+        content_loader = SharedContentLoader(_loaded_content_loader(content_path))
+        brief = dict(self.brief, frameworkSlug='digital-outcomes-and-specialists')
+        with mock.patch('app.main.helpers.content.monotonic', return_value=1000):
+            content_loader.watch_for_changes(CONTENT_MANIFESTS, interval=60)
+            first = get_filtered_brief_manifest(content_loader, 'display_brief_response', brief, 'digital-specialists')
+        _change_day_rate_question(content_path, "Daily rate")
+
+        with mock.patch('app.main.helpers.content.monotonic', return_value=1060):
+            second = get_filtered_brief_manifest(content_loader, 'display_brief_response', brief, 'digital-specialists')
+            third = get_filtered_brief_manifest(content_loader, 'display_brief_response', brief, 'digital-specialists')
+
+        assert first.get_question('dayRate').question == 'Day rate'
+        assert second.get_question('dayRate').question == 'Daily rate'
+        assert third is second
+
+    def test_filtered_manifest_is_not_reused_when_brief_or_context_changes(self):
+        content_loader = mock.Mock()
+
+        get_filtered_brief_manifest(content_loader, 'edit_brief_response', self.brief, 'digital-specialists')
+        get_filtered_brief_manifest(
+            content_loader, 'edit_brief_response', dict(self.brief, updatedAt='2016-03-30T10:11:13.000000Z'),
+            'digital-specialists'
+        )
+        get_filtered_brief_manifest(
+            content_loader, 'edit_brief_response', dict(self.brief, essentialRequirements=['Essential two']),
+            'digital-specialists'
+        )
+        get_filtered_brief_manifest(
+            content_loader, 'edit_brief_response', self.brief, 'digital-specialists', max_day_rate='£300'
+        )
+        get_filtered_brief_manifest(content_loader, 'edit_brief_response', self.brief, 'digital-outcomes')
+
+        assert content_loader.get_manifest.call_count == 5
+
+
+class TestGetBriefSummary(BaseApplicationTest):
+
+    def setup_method(self, method):
+        super().setup_method(method)
+        brief_summary_cache.clear()
+        self.brief = {
+            'id': 1234,
+            'frameworkSlug': 'digital-outcomes-and-specialists-4',
+            'updatedAt': '2016-03-29T10:11:13.000000Z',
+            'status': 'closed',
+        }
+
+    def test_summarises_brief(self):
+        content_loader = mock.Mock()
+
+        with self.app.app_context():
+            summary = get_brief_summary(content_loader, self.brief, 'digital-specialists')
+
+        assert summary == content_loader.get_manifest.return_value.filter.return_value.summary.return_value
+        content_loader.get_manifest.assert_called_once_with('digital-outcomes-and-specialists-4', 'edit_brief')
+        content_loader.get_manifest.return_value.filter.assert_called_once_with({'lot': 'digital-specialists'})
+        content_loader.get_manifest.return_value.filter.return_value.summary.assert_called_once_with(self.brief)
+
+    def test_summary_is_cached_until_brief_changes(self):
+        content_loader = mock.Mock()
+
+        with self.app.app_context():
+            first = get_brief_summary(content_loader, self.brief, 'digital-specialists')
+            second = get_brief_summary(content_loader, dict(self.brief), 'digital-specialists')
+            get_brief_summary(
+                content_loader, dict(self.brief, updatedAt='2016-03-30T10:11:13.000000Z'), 'digital-specialists'
+            )
+
+        assert first is second
+        assert content_loader.get_manifest.call_count == 2
+
+    @pytest.mark.parametrize('status, expected_ttl', [('live', 300), ('closed', 86400), ('awarded', 86400)])
+    def test_summaries_of_briefs_which_cant_change_are_kept_for_longer(self, status, expected_ttl):
+        self.app.config['DM_BRIEF_SUMMARY_CACHE_TTL'] = 300
+        self.app.config['DM_CLOSED_BRIEF_SUMMARY_CACHE_TTL'] = 86400
+        brief_summary_cache.configure(ttl=300)
+
+        with self.app.app_context(), mock.patch('app.cache.monotonic', return_value=1000):
+            get_brief_summary(mock.Mock(), dict(self.brief, status=status), 'digital-specialists')
+
+        assert [expires_at for value, expires_at in brief_summary_cache._entries.values()] == [1000 + expected_ttl]
+
+
+class TestQuestionNavigation(object):
+
+    def setup_method(self, method):
+        self.section = mock.Mock(questions=[
+            mock.Mock(id='essentialRequirementsMet'),
+            mock.Mock(id='essentialRequirements'),
+            mock.Mock(id='niceToHaveRequirements'),
+            mock.Mock(id='respondToEmailAddress'),
+        ])
+        self.brief = {
+            'essentialRequirements': ['Essential one'],
+            'niceToHaveRequirements': ['Nice one'],
+        }
+
+    def test_navigation_follows_question_order(self):
+        navigation = QuestionNavigation(self.section, self.brief)
+
+        assert navigation.get_next_question_id() == 'essentialRequirementsMet'
+        assert navigation.get_next_question_id('essentialRequirements') == 'niceToHaveRequirements'
+        assert navigation.get_previous_question_id('niceToHaveRequirements') == 'essentialRequirements'
+        assert navigation.get_previous_question_id('essentialRequirementsMet') is None
+        assert navigation.get_next_question_id('respondToEmailAddress') is None
+        assert navigation.is_last_question('respondToEmailAddress')
+        assert not navigation.is_last_question('essentialRequirementsMet')
+        assert navigation.get_position('niceToHaveRequirements') == (3, 4)
+
+    def test_navigation_skips_questions_the_brief_has_left_empty(self):
+        self.brief['niceToHaveRequirements'] = []
+        navigation = QuestionNavigation(self.section, self.brief)
+
+        assert navigation.get_next_question_id('essentialRequirements') == 'respondToEmailAddress'
+        assert navigation.get_previous_question_id('respondToEmailAddress') == 'essentialRequirements'
+        assert navigation.get_position('respondToEmailAddress') == (3, 3)
+        assert navigation.get_position('niceToHaveRequirements') is None
+
+    def test_navigation_for_unknown_question(self):
+        navigation = QuestionNavigation(self.section, self.brief)
+
+        assert navigation.get_next_question_id('notAQuestion') is None
+        assert navigation.get_previous_question_id('notAQuestion') is None
+
+    def test_get_question_navigation_reuses_navigation_for_the_same_section(self):
+        navigation = get_question_navigation(self.section, self.brief)
+
+        assert get_question_navigation(self.section, self.brief) is navigation
+        assert get_question_navigation(mock.Mock(questions=[]), self.brief) is not navigation
+
+
+class TestContentIndex(object):
+
+    def setup_method(self, method):
+        self.content = ContentManifest([
+            {
+                'slug': 'about-you',
+                'name': 'About you',
+                'questions': [
+                    {'id': 'name', 'type': 'text', 'question': 'Name'},
+                ],
+            },
+            {
+                'slug': 'your-application',
+                'name': 'Your application',
+                'editable': True,
+                'questions': [
+                    {'id': 'availability', 'type': 'text', 'question': 'Availability'},
+                    {
+                        'id': 'contact',
+                        'type': 'multiquestion',
+                        'question': 'Contact',
+                        'questions': [
+                            {'id': 'respondToEmailAddress', 'type': 'text', 'question': 'Email address'},
+                        ],
+                    },
+                    {
+                        'id': 'price',
+                        'type': 'pricing',
+                        'question': 'Price',
+                        'fields': {'minimum_price': 'priceMin', 'maximum_price': 'priceMax'},
+                    },
+                ],
+            },
+        ])
+
+    def test_next_editable_section(self):
+        index = ContentIndex(self.content)
+
+        assert index.next_editable_section is self.content.get_section('your-application')
+        assert index.get_section('about-you') is self.content.get_section('about-you')
+
+    @pytest.mark.parametrize(
+        'question_id', ['availability', 'contact', 'respondToEmailAddress', 'price', 'priceMax', 'name', 'missing']
+    )
+    def test_get_question_matches_section_get_question(self, question_id):
+        index = ContentIndex(self.content)
+        section = self.content.get_section('your-application')
+
+        assert index.get_question(question_id, section) is section.get_question(question_id)
+
+    def test_get_question_from_any_section(self):
+        index = ContentIndex(self.content)
+
+        assert index.get_question('name') is self.content.get_question('name')
+        assert index.get_question_section('name') is self.content.get_section('about-you')
+        assert index.get_question_section('priceMin') is self.content.get_section('your-application')
+        assert index.get_question('missing') is None
+
+    def test_get_content_index_reuses_index_for_the_same_manifest(self):
+        index = get_content_index(self.content)
+
+        assert get_content_index(self.content) is index
+
+
+class TestInjectBriefQuestions(object):
+
+    def test_injects_brief_questions_without_changing_original_content(self, content_path):
+        content_loader = SharedContentLoader(_loaded_content_loader(content_path))
+        content = content_loader.get_manifest('digital-outcomes-and-specialists', 'display_brief_response')
+        brief = {'id': 1234, 'essentialRequirements': ['Essential one', 'Essential two']}
+
+        injected = inject_brief_questions(content, brief)
+
+        assert injected.get_question('essentialRequirements').boolean_list_questions == [
+            'Essential one', 'Essential two'
+        ]
+        assert 'boolean_list_questions' not in vars(content.get_question('essentialRequirements'))
+
+    def test_only_copies_boolean_list_questions(self, content_path):
+        content_loader = SharedContentLoader(_loaded_content_loader(content_path))
+        content = content_loader.get_manifest('digital-outcomes-and-specialists', 'display_brief_response')
+        brief = {'id': 1234, 'essentialRequirements': ['Essential one']}
+
+        injected = inject_brief_questions(content, brief)
+
+        assert injected.get_question('dayRate') is content.get_question('dayRate')
+        assert injected.get_question('essentialRequirements') is not content.get_question('essentialRequirements')
+
+    def test_display_manifest_is_cached_per_brief_version(self, content_path):
+        filtered_manifest_cache.clear()
+        content_loader = SharedContentLoader(_loaded_content_loader(content_path))
+        brief = {
+            'id': 1234,
+            'frameworkSlug': 'digital-outcomes-and-specialists',
+            'updatedAt': '2016-03-29T10:11:13.000000Z',
+            'essentialRequirements': ['Essential one'],
+        }
+
+        first = get_brief_response_display_manifest(
+            content_loader, 'display_brief_response', brief, 'digital-specialists'
+        )
+        second = get_brief_response_display_manifest(
+            content_loader, 'display_brief_response', dict(brief), 'digital-specialists'
+        )
+        changed = get_brief_response_display_manifest(
+            content_loader, 'display_brief_response', dict(brief, essentialRequirements=['Essential two']),
+            'digital-specialists'
+        )
+
+        assert first is second
+        assert first.get_question('essentialRequirements').boolean_list_questions == ['Essential one']
+        assert changed.get_question('essentialRequirements').boolean_list_questions == ['Essential two']
+
+
+class TestContentBundle(object):
+
+    def test_content_bundle_round_trip(self, content_path):
+        bundle_path = os.path.join(content_path, 'content-bundle.pickle')
+        write_content_bundle(bundle_path, content_path, CONTENT_MANIFESTS)
+
+        bundle = read_content_bundle(bundle_path, content_path, CONTENT_MANIFESTS)
+        # the YAML shouldn't be needed any more
+        os.remove(os.path.join(
+            content_path, 'frameworks', 'digital-outcomes-and-specialists', 'manifests', 'display_brief_response.yml'
+        ))
+
+        content_loader = BundledContentLoader(content_path, bundle)
+        content_loader.load_manifest('digital-outcomes-and-specialists', 'brief-responses', 'display_brief_response')
+        manifest = content_loader.get_manifest('digital-outcomes-and-specialists', 'display_brief_response')
+
+        assert manifest.get_question('dayRate').question == 'Day rate'
+
+    def test_read_content_bundle_returns_none_for_missing_bundle(self, content_path):
+        bundle_path = os.path.join(content_path, 'content-bundle.pickle')
+
+        assert read_content_bundle(bundle_path, content_path, CONTENT_MANIFESTS) is None
+
+    def test_read_content_bundle_returns_none_for_stale_bundle(self, content_path):
+        bundle_path = os.path.join(content_path, 'content-bundle.pickle')
+        write_content_bundle(bundle_path, content_path, CONTENT_MANIFESTS)
+
+        with open(os.path.join(
+            content_path, 'frameworks', 'digital-outcomes-and-specialists', 'questions', 'brief-responses',
+            'dayRate.yml'
+        ), 'a') as f:
+            f.write("hint: Changed since the bundle was built\n")
+
+        assert read_content_bundle(bundle_path, content_path, CONTENT_MANIFESTS) is None
+
+    def test_bundled_content_loader_falls_back_to_yaml(self, content_path):
+        content_loader = BundledContentLoader(content_path, bundle=None)
+        content_loader.load_manifest('digital-outcomes-and-specialists', 'brief-responses', 'display_brief_response')
+
+        manifest = content_loader.get_manifest('digital-outcomes-and-specialists', 'display_brief_response')
+        assert manifest.get_question('dayRate').question == 'Day rate'
@@ -4,6 +4,8 @@ import mock
 from freezegun import freeze_time
 from lxml import html
 from dmapiclient import APIError
+from app.main.helpers.frameworks import opportunities_dashboard_cache
+from app.main.views.frameworks import _completed_row, _draft_row
 from ..helpers import BaseApplicationTest
 
 
@@ -259,3 +261,83 @@ class TestOpportunitiesDashboard(BaseApplicationTest):
 
         assert [row.getchildren()[2].text_content().strip() for row in rows][0] == "Draft"
         assert [row.getchildren()[3].text_content().strip() for row in rows][0] == "Applications closed"
+
+    def _get_dashboard(self, query_string=''):
+        self.data_api_client.get_framework.return_value = self.framework_response
+        self.data_api_client.get_supplier_framework_info.return_value = self.supplier_framework_response
+        self.data_api_client.find_brief_responses.return_value = self.find_brief_responses_response
+
+        return self.client.get(self.opportunities_dashboard_url + query_string)
+
+    def test_tables_are_paginated(self):
+        self.app.config['DM_OPPORTUNITIES_DASHBOARD_PAGE_SIZE'] = 2
+
+        with freeze_time('2017-06-16'):
+            res = self._get_dashboard('?drafts_page=2')
+
+        assert res.status_code == 200
+        doc = html.fromstring(res.get_data(as_text=True))
+
+        drafts = doc.xpath(".//table[@id='draft-opportunities']/tbody")[0].find_class('govuk-table__row')
+        assert ['Highest date' in row.text_content() for row in drafts] == [True]
+        assert doc.xpath("//*[@id='draft-opportunities-pagination']//a/@href") == [
+            self.opportunities_dashboard_url + '?drafts_page=1'
+        ]
+
+        completed = doc.xpath(".//table[@id='submitted-opportunities']/tbody")[0].find_class('govuk-table__row')
+        assert len(completed) == 2
+        next_completed_page, = doc.xpath("//*[@id='submitted-opportunities-pagination']//a/@href")
+        assert 'completed_page=2' in next_completed_page
+        assert 'drafts_page=2' in next_completed_page
+
+    @mock.patch('app.main.views.frameworks._completed_row', wraps=_completed_row)
+    @mock.patch('app.main.views.frameworks._draft_row', wraps=_draft_row)
+    def test_rows_are_only_built_for_the_pages_shown(self, draft_row, completed_row):
+        self.app.config['DM_OPPORTUNITIES_DASHBOARD_PAGE_SIZE'] = 1
+
+        with freeze_time('2017-06-16'):
+            res = self._get_dashboard('?completed_page=2')
+
+        assert res.status_code == 200
+        assert [call[0][0]['id'] for call in draft_row.call_args_list] == [5]
+        assert [call[0][0]['id'] for call in completed_row.call_args_list] == [3]
+
+    def test_tables_with_a_single_page_have_no_page_links(self):
+        res = self._get_dashboard()
+
+        assert res.status_code == 200
+        doc = html.fromstring(res.get_data(as_text=True))
+        assert not doc.xpath("//*[@id='draft-opportunities-pagination']")
+        assert not doc.xpath("//*[@id='submitted-opportunities-pagination']")
+
+    @pytest.mark.parametrize('query_string', ['?drafts_page=0', '?completed_page=2'])
+    def test_404_for_page_out_of_range(self, query_string):
+        res = self._get_dashboard(query_string)
+
+        assert res.status_code == 404
+
+    def test_rows_are_cached_between_visits(self):
+        self._get_dashboard()
+        res = self._get_dashboard('?drafts_page=1')
+
+        assert res.status_code == 200
+        assert self.data_api_client.get_supplier_framework_info.call_count == 1
+        assert self.data_api_client.find_brief_responses.call_count == 1
+
+    def test_supplier_sees_their_changes_made_through_another_instance(self):
+        self._get_dashboard()
+
+        # starting a brief response, on an instance which can't drop this one's cached brief responses
+        with mock.patch('app.main.views.briefs.data_api_client') as briefs_data_api_client, \
+                mock.patch('app.main.views.briefs.get_brief') as get_brief, \
+                mock.patch('app.main.views.briefs.is_supplier_eligible_for_brief', return_value=True), \
+                mock.patch.object(opportunities_dashboard_cache, 'delete'):
+            get_brief.return_value = {'id': 100, 'frameworkSlug': 'digital-outcomes-and-specialists-2'}
+            briefs_data_api_client.find_brief_responses.return_value = {'briefResponses': []}
+            briefs_data_api_client.create_brief_response.return_value = {'briefResponses': {'id': 10}}
+            assert self.client.post('/suppliers/opportunities/100/responses/start').status_code == 302
+
+        res = self._get_dashboard()
+
+        assert res.status_code == 200
+        assert self.data_api_client.find_brief_responses.call_count == 2
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+import mock
+import pytest
+from dmapiclient import HTTPError
+from flask import Flask
+from werkzeug.exceptions import NotFound
+
+from app.main.helpers.frameworks import (
+    framework_cache,
+    get_framework,
+    get_framework_and_lot,
+    get_framework_lot,
+    get_supplier_opportunities,
+    invalidate_framework,
+    invalidate_opportunities_dashboard,
+    opportunities_dashboard_cache,
+)
+
+
+class TestFrameworkHelpers(object):
+
+    def setup_method(self, method):
+        framework_cache.configure(maxsize=32, ttl=300, stale_ttl=0, stale_if_error_ttl=0)
+        self.framework = {
+            'slug': 'digital-outcomes-and-specialists-4',
+            'status': 'live',
+            'lots': [
+                {'slug': 'digital-outcomes', 'name': 'Digital outcomes'},
+                {'slug': 'digital-specialists', 'name': 'Digital specialists'},
+            ],
+        }
+        self.client = mock.Mock()
+        self.client.get_framework.return_value = {'frameworks': self.framework}
+
+    def test_get_framework_and_lot(self):
+        framework, lot = get_framework_and_lot(self.client, 'digital-outcomes-and-specialists-4', 'digital-specialists')
+
+        assert framework == self.framework
+        assert lot == {'slug': 'digital-specialists', 'name': 'Digital specialists'}
+
+    def test_get_framework_and_lot_404s_for_unknown_lot(self):
+        with pytest.raises(NotFound):
+            get_framework_and_lot(self.client, 'digital-outcomes-and-specialists-4', 'user-research-studios')
+
+    def test_get_framework_404s_for_status_not_allowed(self):
+        with pytest.raises(NotFound):
+            get_framework(self.client, 'digital-outcomes-and-specialists-4', allowed_statuses=['open'])
+
+    def test_frameworks_are_cached_between_calls(self):
+        get_framework(self.client, 'digital-outcomes-and-specialists-4')
+        get_framework_and_lot(self.client, 'digital-outcomes-and-specialists-4', 'digital-outcomes')
+
+        self.client.get_framework.assert_called_once_with('digital-outcomes-and-specialists-4')
+
+    def test_cached_framework_status_is_still_checked(self):
+        get_framework(self.client, 'digital-outcomes-and-specialists-4')
+
+        with pytest.raises(NotFound):
+            get_framework(self.client, 'digital-outcomes-and-specialists-4', allowed_statuses=['expired'])
+
+    def test_frameworks_are_fetched_again_once_ttl_has_passed(self):
+        with mock.patch('app.cache.monotonic', return_value=1000):
+            get_framework(self.client, 'digital-outcomes-and-specialists-4')
+        with mock.patch('app.cache.monotonic', return_value=1300):
+            get_framework(self.client, 'digital-outcomes-and-specialists-4')
+
+        assert self.client.get_framework.call_count == 2
+
+    def test_cached_framework_is_served_if_the_api_is_unavailable(self):
+        framework_cache.configure(ttl=300, stale_ttl=0, stale_if_error_ttl=3600)
+        with mock.patch('app.cache.monotonic', return_value=1000):
+            get_framework(self.client, 'digital-outcomes-and-specialists-4')
+
+        self.client.get_framework.side_effect = HTTPError(mock.Mock(status_code=503))
+        with mock.patch('app.cache.monotonic', return_value=1300):
+            assert get_framework(self.client, 'digital-outcomes-and-specialists-4') == self.framework
+
+        assert self.client.get_framework.call_count == 2
+
+    def test_framework_not_found_is_not_served_from_the_cache(self):
+        framework_cache.configure(ttl=0, stale_ttl=0, stale_if_error_ttl=3600)
+        get_framework(self.client, 'digital-outcomes-and-specialists-4')
+
+        self.client.get_framework.side_effect = HTTPError(mock.Mock(status_code=404))
+        with pytest.raises(HTTPError):
+            get_framework(self.client, 'digital-outcomes-and-specialists-4')
+
+    @pytest.mark.parametrize('framework_slug', ['digital-outcomes-and-specialists-4', None])
+    def test_invalidate_framework(self, framework_slug):
+        get_framework(self.client, 'digital-outcomes-and-specialists-4')
+
+        invalidate_framework(framework_slug)
+        get_framework(self.client, 'digital-outcomes-and-specialists-4')
+
+        assert self.client.get_framework.call_count == 2
+
+    def test_get_framework_lot(self):
+        assert get_framework_lot(self.framework, 'digital-outcomes') == {
+            'slug': 'digital-outcomes', 'name': 'Digital outcomes'
+        }
+
+        with pytest.raises(NotFound):
+            get_framework_lot(self.framework, 'user-research-studios')
+
+
+class TestGetSupplierOpportunities(object):
+
+    def setup_method(self, method):
+        opportunities_dashboard_cache.configure(maxsize=32, ttl=60)
+        self.app = Flask(__name__)
+        self.app.secret_key = 'secret'
+        self.client = mock.Mock()
+        self.client.get_supplier_framework_info.return_value = {'frameworkInterest': {'onFramework': True}}
+        self.client.find_brief_responses.return_value = {'briefResponses': [{'id': 5}]}
+
+    def get_supplier_opportunities(self, supplier_id=1234):
+        return get_supplier_opportunities(
+            self.client, supplier_id, 'digital-outcomes-and-specialists-4', ['draft', 'submitted']
+        )
+
+    def test_returns_supplier_framework_and_brief_responses(self):
+        with self.app.test_request_context():
+            assert self.get_supplier_opportunities() == ({'onFramework': True}, [{'id': 5}])
+
+        self.client.get_supplier_framework_info.assert_called_once_with(
+            supplier_id=1234, framework_slug='digital-outcomes-and-specialists-4'
+        )
+        self.client.find_brief_responses.assert_called_once_with(
+            supplier_id=1234, framework='digital-outcomes-and-specialists-4', status='draft,submitted', with_data=False
+        )
+
+    def test_brief_responses_are_not_fetched_for_suppliers_not_on_the_framework(self):
+        self.client.get_supplier_framework_info.return_value = {'frameworkInterest': {'onFramework': False}}
+
+        with self.app.test_request_context():
+            assert self.get_supplier_opportunities() == ({'onFramework': False}, [])
+
+        assert self.client.find_brief_responses.called is False
+
+    def test_cached_per_supplier(self):
+        with self.app.test_request_context():
+            self.get_supplier_opportunities()
+            self.get_supplier_opportunities()
+            self.get_supplier_opportunities(supplier_id=5678)
+
+        assert self.client.find_brief_responses.call_count == 2
+
+    def test_fetched_again_once_invalidated(self):
+        with self.app.test_request_context():
+            self.get_supplier_opportunities()
+            invalidate_opportunities_dashboard(1234, 'digital-outcomes-and-specialists-4')
+            self.get_supplier_opportunities()
+
+        assert self.client.find_brief_responses.call_count == 2
+
+    def test_invalidating_changes_the_version_in_the_session(self):
+        # so another instance, which keeps its own cache, fetches them again too
+        with self.app.test_request_context():
+            self.get_supplier_opportunities()
+            with mock.patch.object(opportunities_dashboard_cache, 'delete'):
+                invalidate_opportunities_dashboard(1234, 'digital-outcomes-and-specialists-4')
+            self.get_supplier_opportunities()
+            invalidate_opportunities_dashboard(1234, 'digital-outcomes-and-specialists-5')
+            self.get_supplier_opportunities()
+
+        assert self.client.find_brief_responses.call_count == 2
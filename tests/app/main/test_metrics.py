@@ -27,6 +27,12 @@ class TestMetricsPage(BaseApplicationTest):
             b'path="/suppliers/opportunities/_metrics"}'
         ) in results
 
+    def test_metrics_page_includes_content_loader_metrics(self):
+        metrics_response = self.client.get('/suppliers/opportunities/_metrics')
+
+        assert b'content_loader_copies_total' in metrics_response.data
+        assert b'content_loader_copy_duration_seconds_count' in metrics_response.data
+
 
 class TestMetricsPageRegistersPageViews(BaseApplicationTest):
 
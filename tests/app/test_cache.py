@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+from threading import Barrier, Event, Thread, current_thread
+
+import mock
+import pytest
+
+from app.cache import CircuitBreaker, CircuitOpenError, LRUCache, SingleFlight, StaleWhileRevalidateCache
+
+
+class TestLRUCache(object):
+
+    def test_get_returns_default_for_missing_key(self):
+        cache = LRUCache('test')
+
+        assert cache.get('missing') is None
+        assert cache.get('missing', 'default') == 'default'
+
+    def test_set_and_get(self):
+        cache = LRUCache('test')
+        cache.set('key', 'value')
+
+        assert cache.get('key') == 'value'
+
+    def test_evicts_least_recently_used_entry(self):
+        cache = LRUCache('test', maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        assert cache.get('a') == 1
+        assert cache.get('b') is None
+        assert cache.get('c') == 3
+        assert len(cache) == 2
+
+    @mock.patch('app.cache.monotonic')
+    def test_entries_expire_after_ttl(self, monotonic):
+        cache = LRUCache('test', ttl=10)
+
+        monotonic.return_value = 100
+        cache.set('key', 'value')
+        cache.set('other-key', 'other-value', ttl=60)
+
+        monotonic.return_value = 109
+        assert cache.get('key') == 'value'
+
+        monotonic.return_value = 110
+        assert cache.get('key') is None
+        assert cache.get('other-key') == 'other-value'
+
+    def test_get_or_set_only_calls_make_value_on_a_miss(self):
+        cache = LRUCache('test')
+        make_value = mock.Mock(return_value='value')
+
+        assert cache.get_or_set('key', make_value) == 'value'
+        assert cache.get_or_set('key', make_value) == 'value'
+        assert make_value.call_count == 1
+
+    def test_get_or_set_caches_falsey_values(self):
+        cache = LRUCache('test')
+        make_value = mock.Mock(return_value=None)
+
+        cache.get_or_set('key', make_value)
+        cache.get_or_set('key', make_value)
+
+        assert make_value.call_count == 1
+
+    def test_delete_and_clear(self):
+        cache = LRUCache('test')
+        cache.set('a', 1)
+        cache.set('b', 2)
+
+        cache.delete('a')
+        assert cache.get('a') is None
+        assert cache.get('b') == 2
+
+        cache.clear()
+        assert len(cache) == 0
+
+    def test_configure_resizes_and_empties_cache(self):
+        cache = LRUCache('test', maxsize=2)
+        cache.set('a', 1)
+
+        cache.configure(maxsize=0)
+        cache.set('b', 2)
+
+        assert len(cache) == 0
+
+    @mock.patch('app.cache.CACHE_LOOKUPS_TOTAL')
+    def test_lookups_are_counted(self, cache_lookups_total):
+        cache = LRUCache('test')
+        cache.get('key')
+        cache.set('key', 'value')
+        cache.get('key')
+
+        assert cache_lookups_total.labels.call_args_list == [
+            mock.call('test', 'miss'),
+            mock.call('test', 'hit'),
+        ]
+
+
+class TestSingleFlight(object):
+
+    def _call_concurrently(self, function, count):
+        threads = [Thread(target=function) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+    def test_returns_result_of_fetch(self):
+        assert SingleFlight('test').do('key', lambda: 'value') == 'value'
+
+    def test_concurrent_callers_share_one_in_flight_fetch(self):
+        single_flight = SingleFlight('test')
+        started, release = Event(), Event()
+        fetch = mock.Mock(side_effect=lambda: started.set() or release.wait(5) and 'value')
+        results = []
+
+        def call():
+            results.append(single_flight.do('key', fetch))
+
+        leader = Thread(target=call)
+        leader.start()
+        started.wait(5)
+        followers = [Thread(target=call) for _ in range(10)]
+        for follower in followers:
+            follower.start()
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+
+        assert fetch.call_count == 1
+        assert results == ['value'] * 11
+
+    def test_fetches_again_once_call_has_finished_with_no_window(self):
+        single_flight = SingleFlight('test')
+        fetch = mock.Mock(return_value='value')
+
+        single_flight.do('key', fetch)
+        single_flight.do('key', fetch)
+
+        assert fetch.call_count == 2
+
+    def test_different_keys_are_fetched_separately(self):
+        single_flight = SingleFlight('test', window=60)
+        fetch = mock.Mock(return_value='value')
+
+        single_flight.do('key', fetch)
+        single_flight.do('other-key', fetch)
+
+        assert fetch.call_count == 2
+
+    @mock.patch('app.cache.monotonic')
+    def test_result_is_shared_within_window(self, monotonic):
+        single_flight = SingleFlight('test', window=1)
+        fetch = mock.Mock(return_value='value')
+
+        monotonic.return_value = 100
+        single_flight.do('key', fetch)
+        monotonic.return_value = 100.9
+        single_flight.do('key', fetch)
+        assert fetch.call_count == 1
+
+        monotonic.return_value = 101
+        single_flight.do('key', fetch)
+        assert fetch.call_count == 2
+
+    def test_exceptions_are_shared_with_waiting_callers_but_not_kept(self):
+        single_flight = SingleFlight('test', window=60)
+        fetch = mock.Mock(side_effect=ValueError('API is down'))
+
+        with pytest.raises(ValueError):
+            single_flight.do('key', fetch)
+        fetch.side_effect = None
+        fetch.return_value = 'value'
+
+        assert single_flight.do('key', fetch) == 'value'
+
+    def test_stress_upstream_calls_collapse_under_concurrency(self):
+        single_flight = SingleFlight('test', window=1)
+        fetch = mock.Mock(return_value='value')
+        start = Barrier(200, timeout=5)
+        results = []
+
+        def call():
+            start.wait()
+            results.append(single_flight.do('key', fetch))
+
+        self._call_concurrently(call, 200)
+
+        assert results == ['value'] * 200
+        assert fetch.call_count == 1
+
+
+class _Unavailable(Exception):
+    pass
+
+
+class _UnavailableCircuitBreaker(CircuitBreaker):
+    def is_failure(self, exception):
+        return isinstance(exception, _Unavailable)
+
+
+def _fail(exception):
+    raise exception
+
+
+class TestCircuitBreaker(object):
+
+    def setup_method(self, method):
+        self.breaker = _UnavailableCircuitBreaker('test', failure_threshold=2, reset_timeout=30)
+
+    def test_returns_result_of_fetch(self):
+        assert self.breaker.call(lambda: 'value') == 'value'
+
+    def test_opens_after_threshold_failures_in_a_row(self):
+        fetch = mock.Mock(side_effect=_Unavailable)
+
+        for _ in range(2):
+            with pytest.raises(_Unavailable):
+                self.breaker.call(fetch)
+        with pytest.raises(CircuitOpenError):
+            self.breaker.call(fetch)
+
+        assert self.breaker.is_open
+        assert fetch.call_count == 2
+
+    def test_successes_and_other_errors_reset_the_failure_count(self):
+        for fetch in (lambda: _fail(_Unavailable()), lambda: 'value', lambda: _fail(_Unavailable())):
+            try:
+                self.breaker.call(fetch)
+            except _Unavailable:
+                pass
+        with pytest.raises(ValueError):
+            self.breaker.call(lambda: _fail(ValueError()))
+        with pytest.raises(_Unavailable):
+            self.breaker.call(lambda: _fail(_Unavailable()))
+
+        assert not self.breaker.is_open
+
+    @mock.patch('app.cache.monotonic')
+    def test_lets_a_trial_call_through_after_reset_timeout(self, monotonic):
+        monotonic.return_value = 1000
+        for _ in range(2):
+            with pytest.raises(_Unavailable):
+                self.breaker.call(lambda: _fail(_Unavailable()))
+
+        monotonic.return_value = 1029
+        with pytest.raises(CircuitOpenError):
+            self.breaker.call(lambda: 'value')
+
+        monotonic.return_value = 1030
+        assert self.breaker.call(lambda: 'value') == 'value'
+        assert not self.breaker.is_open
+
+    @mock.patch('app.cache.monotonic')
+    def test_failed_trial_call_reopens_circuit(self, monotonic):
+        monotonic.return_value = 1000
+        for _ in range(2):
+            with pytest.raises(_Unavailable):
+                self.breaker.call(lambda: _fail(_Unavailable()))
+
+        monotonic.return_value = 1030
+        with pytest.raises(_Unavailable):
+            self.breaker.call(lambda: _fail(_Unavailable()))
+
+        monotonic.return_value = 1059
+        with pytest.raises(CircuitOpenError):
+            self.breaker.call(lambda: 'value')
+
+    def test_only_one_trial_call_at_a_time(self):
+        self.breaker.configure(failure_threshold=1, reset_timeout=0)
+        with pytest.raises(_Unavailable):
+            self.breaker.call(lambda: _fail(_Unavailable()))
+
+        def trial():
+            with pytest.raises(CircuitOpenError):
+                self.breaker.call(lambda: 'value')
+            return 'trial'
+
+        assert self.breaker.call(trial) == 'trial'
+        assert not self.breaker.is_open
+
+    @mock.patch('app.cache.CIRCUIT_BREAKER_EVENTS_TOTAL')
+    def test_events_are_counted(self, circuit_breaker_events_total):
+        self.breaker.configure(reset_timeout=0)
+        for fetch in (lambda: _fail(_Unavailable()),) * 2:
+            with pytest.raises(_Unavailable):
+                self.breaker.call(fetch)
+        self.breaker.call(lambda: 'value')
+
+        assert circuit_breaker_events_total.labels.call_args_list == [
+            mock.call('test', 'opened'), mock.call('test', 'closed'),
+        ]
+
+    def test_configure_closes_circuit(self):
+        self.breaker.configure(failure_threshold=1)
+        with pytest.raises(_Unavailable):
+            self.breaker.call(lambda: _fail(_Unavailable()))
+
+        self.breaker.configure()
+
+        assert not self.breaker.is_open
+
+
+class TestStaleWhileRevalidateCache(object):
+
+    def setup_method(self, method):
+        self.breaker = _UnavailableCircuitBreaker('test', failure_threshold=3)
+        self.cache = StaleWhileRevalidateCache(
+            'test', self.breaker, ttl=60, stale_ttl=60, stale_if_error_ttl=600,
+        )
+        self.fetch = mock.Mock(side_effect=['first', 'second'])
+
+    @mock.patch('app.cache.monotonic', return_value=1000)
+    def test_fresh_values_are_served_from_the_cache(self, monotonic):
+        assert self.cache.get_or_fetch('key', self.fetch) == 'first'
+        monotonic.return_value = 1059
+        assert self.cache.get_or_fetch('key', self.fetch) == 'first'
+
+        assert self.fetch.call_count == 1
+
+    @mock.patch('app.cache.Thread')
+    @mock.patch('app.cache.monotonic', return_value=1000)
+    def test_stale_values_are_served_while_revalidating_in_the_background(self, monotonic, thread):
+        self.cache.get_or_fetch('key', self.fetch)
+
+        monotonic.return_value = 1061
+        assert self.cache.get_or_fetch('key', self.fetch) == 'first'
+        # only one background revalidation at a time
+        assert self.cache.get_or_fetch('key', self.fetch) == 'first'
+        assert thread.call_count == 1
+        assert self.fetch.call_count == 1
+
+        revalidate = thread.call_args[1]
+        revalidate['target'](*revalidate['args'])
+
+        assert self.cache.get_or_fetch('key', self.fetch) == 'second'
+        assert self.fetch.call_count == 2
+
+    def test_background_revalidation_runs_on_another_thread(self):
+        self.cache.configure(ttl=0)
+        revalidated = Event()
+        fetch_threads = []
+
+        def fetch():
+            fetch_threads.append(current_thread())
+            if len(fetch_threads) > 1:
+                revalidated.set()
+            return len(fetch_threads)
+
+        assert self.cache.get_or_fetch('key', fetch) == 1
+        assert self.cache.get_or_fetch('key', fetch) == 1
+
+        assert revalidated.wait(5)
+        assert fetch_threads[0] is current_thread()
+        assert fetch_threads[1] is not current_thread()
+
+    @mock.patch('app.cache.monotonic', return_value=1000)
+    def test_expired_values_are_fetched_while_the_caller_waits(self, monotonic):
+        self.cache.get_or_fetch('key', self.fetch)
+
+        monotonic.return_value = 1120
+        assert self.cache.get_or_fetch('key', self.fetch) == 'second'
+
+    @mock.patch('app.cache.monotonic', return_value=1000)
+    def test_stale_values_are_served_if_source_is_unavailable(self, monotonic):
+        self.cache.get_or_fetch('key', self.fetch)
+
+        monotonic.return_value = 1599
+        assert self.cache.get_or_fetch('key', lambda: _fail(_Unavailable())) == 'first'
+
+        monotonic.return_value = 1600
+        with pytest.raises(_Unavailable):
+            self.cache.get_or_fetch('key', lambda: _fail(_Unavailable()))
+
+    @mock.patch('app.cache.monotonic', return_value=1000)
+    def test_stale_values_are_served_without_fetching_while_circuit_is_open(self, monotonic):
+        self.cache.get_or_fetch('key', self.fetch)
+
+        monotonic.return_value = 1120
+        self.breaker.configure(failure_threshold=1)
+        with pytest.raises(_Unavailable):
+            self.breaker.call(lambda: _fail(_Unavailable()))
+
+        assert self.cache.get_or_fetch('key', self.fetch) == 'first'
+        assert self.fetch.call_count == 1
+
+    @mock.patch('app.cache.monotonic', return_value=1000)
+    def test_other_errors_are_raised_even_with_a_stale_value(self, monotonic):
+        self.cache.get_or_fetch('key', self.fetch)
+
+        monotonic.return_value = 1120
+        with pytest.raises(ValueError):
+            self.cache.get_or_fetch('key', lambda: _fail(ValueError()))
+
+    def test_errors_are_raised_with_nothing_cached(self):
+        with pytest.raises(_Unavailable):
+            self.cache.get_or_fetch('key', lambda: _fail(_Unavailable()))
+
+    @mock.patch('app.cache.STALE_CACHE_RESPONSES_TOTAL')
+    @mock.patch('app.cache.monotonic', return_value=1000)
+    def test_stale_values_served_are_counted(self, monotonic, stale_cache_responses_total):
+        self.cache.get_or_fetch('key', self.fetch)
+
+        monotonic.return_value = 1120
+        self.cache.get_or_fetch('key', lambda: _fail(_Unavailable()))
+
+        stale_cache_responses_total.labels.assert_called_once_with('test', 'unavailable')
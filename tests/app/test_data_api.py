@@ -0,0 +1,468 @@
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Barrier, Event, Thread, current_thread
+from time import perf_counter, sleep
+
+import mock
+import pytest
+from dmapiclient import APIError, DataAPIClient, HTTPError
+from flask import Flask, current_app, request
+
+from app.data_api import (
+    _HedgedEndpoint,
+    DataAPICircuitBreaker,
+    DataAPICircuitOpenError,
+    PooledDataAPIClient,
+    RequestMemoizingDataAPIClient,
+    fetch_concurrently,
+)
+
+
+class TestRequestMemoizingDataAPIClient(object):
+
+    def setup_method(self, method):
+        self.client = mock.Mock()
+        self.client.get_brief.side_effect = lambda brief_id: {'briefs': {'id': brief_id}}
+        self.data_api_client = RequestMemoizingDataAPIClient(self.client)
+
+        self.app = Flask(__name__)
+        self.data_api_client.init_app(self.app)
+
+    def test_init_app_initialises_wrapped_client(self):
+        self.client.init_app.assert_called_once_with(self.app)
+
+    def test_wrapped_client_methods_can_be_autospecced(self):
+        data_api_client = RequestMemoizingDataAPIClient(DataAPIClient())
+
+        autospecced = mock.create_autospec(data_api_client)
+
+        assert autospecced.get_framework('digital-outcomes-and-specialists')
+        with pytest.raises(AttributeError):
+            autospecced.not_a_real_method
+
+    def test_repeated_read_calls_only_hit_the_api_once_per_request(self):
+        with self.app.test_request_context():
+            assert self.data_api_client.get_brief(1234) == {'briefs': {'id': 1234}}
+            assert self.data_api_client.get_brief(1234) == {'briefs': {'id': 1234}}
+            assert self.data_api_client.get_brief(5678) == {'briefs': {'id': 5678}}
+
+        with self.app.test_request_context():
+            self.data_api_client.get_brief(1234)
+
+        assert self.client.get_brief.call_args_list == [mock.call(1234), mock.call(5678), mock.call(1234)]
+
+    def test_callers_share_the_response_rather_than_copying_it(self):
+        with self.app.test_request_context():
+            assert self.data_api_client.get_brief(1234) is self.data_api_client.get_brief(1234)
+
+    def test_reads_not_known_to_return_json_are_not_memoized(self):
+        self.client.find_brief_responses_iter.side_effect = lambda **kwargs: iter([{'id': 1}, {'id': 2}])
+
+        with self.app.test_request_context():
+            assert list(self.data_api_client.find_brief_responses_iter(supplier_id=1234)) == [{'id': 1}, {'id': 2}]
+            assert list(self.data_api_client.find_brief_responses_iter(supplier_id=1234)) == [{'id': 1}, {'id': 2}]
+            self.data_api_client.get_brief(1234)
+            self.data_api_client.get_brief(1234)
+
+        assert self.client.find_brief_responses_iter.call_count == 2
+        self.client.get_brief.assert_called_once_with(1234)
+
+    def test_write_calls_forget_remembered_responses(self):
+        with self.app.test_request_context():
+            self.data_api_client.get_brief(1234)
+            self.data_api_client.update_brief_response(1, {'essentialRequirementsMet': True}, 'user')
+            self.data_api_client.get_brief(1234)
+
+        assert self.client.get_brief.call_count == 2
+        self.client.update_brief_response.assert_called_once_with(1, {'essentialRequirementsMet': True}, 'user')
+
+    def test_calls_with_unhashable_arguments_are_not_memoized(self):
+        with self.app.test_request_context():
+            self.data_api_client.find_services(lots=['digital-specialists'])
+            self.data_api_client.find_services(lots=['digital-specialists'])
+
+        assert self.client.find_services.call_count == 2
+
+    def test_calls_outside_app_context_go_straight_to_the_api(self):
+        self.data_api_client.get_brief(1234)
+        self.data_api_client.get_brief(1234)
+
+        assert self.client.get_brief.call_count == 2
+
+    def test_logs_number_of_deduplicated_calls_at_end_of_request(self):
+        with mock.patch.object(self.app, 'logger') as logger:
+            with self.app.test_request_context():
+                self.data_api_client.get_brief(1234)
+                self.data_api_client.get_brief(1234)
+                self.data_api_client.get_brief(1234)
+
+        logger.info.assert_called_once_with(
+            "Saved {deduplicated_calls} duplicate data API calls", extra={'deduplicated_calls': 2}
+        )
+
+    def test_does_not_log_if_no_calls_were_deduplicated(self):
+        with mock.patch.object(self.app, 'logger') as logger:
+            with self.app.test_request_context():
+                self.data_api_client.get_brief(1234)
+
+        assert logger.info.called is False
+
+
+class TestFetchConcurrently(object):
+
+    def setup_method(self, method):
+        self.app = Flask(__name__)
+        self.app.config['DM_DATA_API_FETCH_WORKERS'] = 2
+        # a pool of its own for each test, sized from the config above
+        self.fetch_pool_patch = mock.patch.multiple('app.data_api', _fetch_executor=None, _fetch_slots=None)
+        self.fetch_pool_patch.start()
+
+    def teardown_method(self, method):
+        self.fetch_pool_patch.stop()
+
+    def test_returns_results_in_order(self):
+        with self.app.test_request_context():
+            assert fetch_concurrently(lambda: 1, lambda: 2, lambda: 3) == [1, 2, 3]
+
+    def test_fetches_run_at_the_same_time(self):
+        barrier = Barrier(3, timeout=5)
+
+        with self.app.test_request_context():
+            # would time out if the fetches were made one after another
+            assert fetch_concurrently(barrier.wait, barrier.wait, barrier.wait)
+
+    def test_fetches_run_in_the_request_context(self):
+        with self.app.test_request_context('/some/path'):
+            assert fetch_concurrently(lambda: request.path, lambda: current_app.name) == ['/some/path', self.app.name]
+
+    def test_raises_first_exception_once_all_fetches_have_finished(self):
+        finished = Event()
+
+        def slow_fetch():
+            finished.wait(0.1)
+            finished.set()
+
+        def fail(message):
+            raise ValueError(message)
+
+        with self.app.test_request_context():
+            with pytest.raises(ValueError, match='first'):
+                fetch_concurrently(lambda: fail('first'), slow_fetch, lambda: fail('second'))
+
+        assert finished.is_set()
+
+    def test_first_fetch_is_made_by_the_calling_thread(self):
+        with self.app.test_request_context():
+            caller_thread, pool_thread = fetch_concurrently(current_thread, current_thread)
+
+        assert caller_thread == current_thread()
+        assert pool_thread != current_thread()
+
+    def test_fetches_are_made_by_the_calling_thread_while_every_pool_thread_is_busy(self):
+        busy = Barrier(3, timeout=5)
+        finish = Event()
+
+        def occupy_pool():
+            busy.wait()
+            finish.wait(5)
+
+        def other_request():
+            with self.app.test_request_context():
+                fetch_concurrently(lambda: None, occupy_pool, occupy_pool)
+
+        other_request_thread = Thread(target=other_request)
+        other_request_thread.start()
+        try:
+            busy.wait()
+            with self.app.test_request_context():
+                started = perf_counter()
+                assert fetch_concurrently(current_thread, current_thread, current_thread) == [current_thread()] * 3
+                assert perf_counter() - started < 1
+        finally:
+            finish.set()
+            other_request_thread.join()
+
+    def test_fetches_are_made_one_after_another_outside_a_request(self):
+        calls = []
+
+        fetch_concurrently(lambda: calls.append(current_thread()), lambda: calls.append(current_thread()))
+
+        assert calls == [current_thread(), current_thread()]
+
+    def test_nested_fetches_are_made_one_after_another(self):
+        with self.app.test_request_context():
+            (worker_thread, nested_fetch_threads), _ = fetch_concurrently(
+                lambda: (current_thread(), fetch_concurrently(current_thread, current_thread)),
+                lambda: None,
+            )
+
+        assert nested_fetch_threads == [worker_thread, worker_thread]
+
+
+class _APIRequestHandler(BaseHTTPRequestHandler):
+    """A stand-in data API serving `server.resources` (path -> (etag, data)) and recording the requests made.
+
+    Each request is answered after sleeping for the next of `server.delays` (seconds), if there are any left.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        etag, data = self.server.resources.get(self.path, (None, {'briefs': {'id': 1234}}))
+        not_modified = etag is not None and self.headers.get('If-None-Match') == etag
+        self.server.requests.append((self.path, self.headers.get('If-None-Match'), 304 if not_modified else 200))
+
+        if self.server.delays:
+            sleep(self.server.delays.pop(0))
+
+        body = b'' if not_modified else json.dumps(data).encode('utf-8')
+        self.send_response(304 if not_modified else 200)
+        if etag is not None:
+            self.send_header('ETag', etag)
+        if not not_modified:
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestPooledDataAPIClient(object):
+
+    def setup_method(self, method):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _APIRequestHandler)
+        self.server.resources = {}
+        self.server.requests = []
+        self.server.delays = []
+        self.server_thread = Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.01})
+        self.server_thread.start()
+
+        self.app = Flask(__name__)
+        self.app.config.update({
+            'DM_DATA_API_URL': 'http://127.0.0.1:{}'.format(self.server.server_port),
+            'DM_DATA_API_AUTH_TOKEN': 'myToken',
+            'DM_DATA_API_POOL_CONNECTIONS': 1,
+            'DM_DATA_API_POOL_MAXSIZE': 2,
+            'DM_DATA_API_POOL_BLOCK': False,
+            'DM_DATA_API_RESPONSE_CACHE_SIZE': 8,
+            'DM_DATA_API_HEDGED_PATHS': [],
+            'DM_DATA_API_HEDGE_PERCENTILE': 95,
+            'DM_DATA_API_HEDGE_BUDGET': 0.05,
+            'DM_DATA_API_HEDGE_WORKERS': 4,
+        })
+        self.data_api_client = PooledDataAPIClient()
+        self.data_api_client.init_app(self.app)
+
+    def teardown_method(self, method):
+        self.server.shutdown()
+        self.server.server_close()
+        self.server_thread.join()
+
+    def test_init_app_configures_pool(self):
+        adapter = self.data_api_client._requests_retry_session().get_adapter('http://')
+
+        assert adapter._pool_connections == 1
+        assert adapter._pool_maxsize == 2
+        assert adapter._pool_block is False
+
+    def test_keeps_retry_policy_of_data_api_client(self):
+        retrying_adapter = self.data_api_client._requests_retry_session().get_adapter('http://')
+        non_retrying_adapter = self.data_api_client._requests_retry_session(
+            retry_read_timeouts=False
+        ).get_adapter('http://')
+
+        assert retrying_adapter.max_retries.read == PooledDataAPIClient._RETRIES
+        assert non_retrying_adapter.max_retries.read == 0
+
+    @mock.patch('app.data_api.DATA_API_CONNECTIONS_CREATED_TOTAL')
+    def test_reuses_connections_between_requests(self, connections_created_total):
+        with self.app.app_context():
+            for _ in range(3):
+                assert self.data_api_client.get_brief(1234) == {'briefs': {'id': 1234}}
+
+        assert connections_created_total.inc.call_count == 1
+
+    def test_conditional_get_miss_then_not_modified(self):
+        self.server.resources['/briefs/1234'] = ('"v1"', {'briefs': {'id': 1234, 'title': 'First'}})
+
+        with self.app.app_context():
+            first = self.data_api_client.get_brief(1234)
+            second = self.data_api_client.get_brief(1234)
+
+        assert first == second == {'briefs': {'id': 1234, 'title': 'First'}}
+        assert self.server.requests == [('/briefs/1234', None, 200), ('/briefs/1234', '"v1"', 304)]
+
+    def test_conditional_get_picks_up_changes(self):
+        self.server.resources['/brief-responses/5'] = ('"v1"', {'briefResponses': {'id': 5, 'status': 'draft'}})
+
+        with self.app.app_context():
+            self.data_api_client.get_brief_response(5)
+            self.server.resources['/brief-responses/5'] = (
+                '"v2"', {'briefResponses': {'id': 5, 'status': 'submitted'}}
+            )
+            changed = self.data_api_client.get_brief_response(5)
+            unchanged = self.data_api_client.get_brief_response(5)
+
+        assert changed == unchanged == {'briefResponses': {'id': 5, 'status': 'submitted'}}
+        assert [status for path, if_none_match, status in self.server.requests] == [200, 200, 304]
+        assert self.server.requests[2][1] == '"v2"'
+
+    def test_responses_without_validators_are_not_revalidated(self):
+        with self.app.app_context():
+            self.data_api_client.get_brief(1234)
+            self.data_api_client.get_brief(1234)
+
+        assert self.server.requests == [('/briefs/1234', None, 200), ('/briefs/1234', None, 200)]
+
+    def test_only_briefs_and_brief_responses_are_revalidated(self):
+        self.server.resources['/frameworks/g-cloud-12'] = ('"v1"', {'frameworks': {'slug': 'g-cloud-12'}})
+
+        with self.app.app_context():
+            self.data_api_client.get_framework('g-cloud-12')
+            self.data_api_client.get_framework('g-cloud-12')
+
+        assert [if_none_match for path, if_none_match, status in self.server.requests] == [None, None]
+
+    def _warm_up_hedging(self, budget):
+        self.data_api_client.configure_hedging(
+            paths=[r'^/briefs/\d+$'], percentile=95, budget=budget, workers=4, min_samples=5,
+        )
+        with self.app.app_context():
+            for _ in range(5):
+                self.data_api_client.get_brief(1234)
+        self.server.requests = []
+
+    def test_slow_gets_are_hedged(self):
+        self._warm_up_hedging(budget=1)
+        self.server.delays = [0.2]
+
+        with self.app.test_request_context():
+            assert self.data_api_client.get_brief(1234) == {'briefs': {'id': 1234}}
+
+        assert [path for path, if_none_match, status in self.server.requests] == ['/briefs/1234', '/briefs/1234']
+
+    def test_hedge_answers_if_the_request_fails(self):
+        self._warm_up_hedging(budget=1)
+        endpoint = self.data_api_client._hedged_endpoints[0]
+        calling_thread = current_thread()
+
+        def request():
+            if current_thread() is calling_thread:
+                sleep(0.2)
+                raise HTTPError(mock.Mock(status_code=503))
+            return {'briefs': {'id': 1234}}
+
+        with self.app.test_request_context():
+            assert self.data_api_client._hedged_request(endpoint, 0.01, request) == {'briefs': {'id': 1234}}
+
+    def test_requests_failing_before_they_are_slow_are_not_hedged(self):
+        self._warm_up_hedging(budget=1)
+        endpoint = self.data_api_client._hedged_endpoints[0]
+        request = mock.Mock(side_effect=HTTPError(mock.Mock(status_code=404)))
+
+        with self.app.test_request_context():
+            with pytest.raises(HTTPError):
+                self.data_api_client._hedged_request(endpoint, 0.2, request)
+
+        assert request.call_count == 1
+
+    def test_gets_are_not_hedged_while_every_hedging_thread_is_busy(self):
+        self._warm_up_hedging(budget=1)
+        for _ in range(4):
+            self.data_api_client._hedge_slots.acquire()
+        self.server.delays = [0.2]
+
+        try:
+            with self.app.test_request_context():
+                start = perf_counter()
+                assert self.data_api_client.get_brief(1234) == {'briefs': {'id': 1234}}
+                duration = perf_counter() - start
+        finally:
+            for _ in range(4):
+                self.data_api_client._hedge_slots.release()
+
+        assert duration >= 0.2
+        assert len(self.server.requests) == 1
+
+    def test_hedging_stays_within_budget(self):
+        self._warm_up_hedging(budget=0)
+        self.server.delays = [0.2]
+
+        with self.app.app_context():
+            start = perf_counter()
+            self.data_api_client.get_brief(1234)
+            duration = perf_counter() - start
+
+        assert duration >= 0.2
+        assert len(self.server.requests) == 1
+
+    def test_only_matching_gets_are_hedged(self):
+        self._warm_up_hedging(budget=1)
+        self.server.delays = [0.2]
+
+        with self.app.app_context():
+            start = perf_counter()
+            self.data_api_client.get_framework('g-cloud-12')
+            duration = perf_counter() - start
+
+        assert duration >= 0.2
+        assert len(self.server.requests) == 1
+
+
+class TestHedgedEndpoint(object):
+
+    def test_no_delay_until_there_are_enough_samples(self):
+        endpoint = _HedgedEndpoint(None, percentile=50, budget=1, min_samples=3)
+        endpoint.record(0.1)
+        endpoint.record(0.2)
+
+        assert endpoint.delay() is None
+
+        endpoint.record(0.3)
+
+        assert endpoint.delay() == 0.2
+
+    def test_delay_is_percentile_of_recent_durations(self):
+        endpoint = _HedgedEndpoint(None, percentile=90, budget=1, history=10, min_samples=1)
+        for duration in range(100):
+            endpoint.record(duration)
+
+        assert endpoint.delay() == 98
+
+    def test_budget_limits_hedges_to_a_fraction_of_requests(self):
+        endpoint = _HedgedEndpoint(None, percentile=90, budget=0.25, max_tokens=1)
+
+        hedges = 0
+        for _ in range(100):
+            endpoint.delay()
+            hedges += endpoint.take_token()
+
+        assert hedges == 25
+
+
+class TestDataAPICircuitBreaker(object):
+
+    def setup_method(self, method):
+        self.breaker = DataAPICircuitBreaker('test', failure_threshold=1)
+
+    @pytest.mark.parametrize('exception, is_failure', [
+        (HTTPError(mock.Mock(status_code=503)), True),
+        (HTTPError(mock.Mock(status_code=504)), True),
+        (HTTPError(), True),  # timeouts and connection errors, which have no response
+        (HTTPError(mock.Mock(status_code=404)), False),
+        (HTTPError(mock.Mock(status_code=400)), False),
+        (ValueError(), False),
+    ])
+    def test_is_failure(self, exception, is_failure):
+        assert self.breaker.is_failure(exception) is is_failure
+
+    def test_open_circuit_raises_a_503_api_error(self):
+        with pytest.raises(HTTPError):
+            self.breaker.call(mock.Mock(side_effect=HTTPError()))
+
+        with pytest.raises(DataAPICircuitOpenError) as e:
+            self.breaker.call(mock.Mock())
+
+        assert isinstance(e.value, APIError)
+        assert e.value.status_code == 503